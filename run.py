@@ -1,4 +1,7 @@
 import runpy
 
-# Execute a module by its full module name
-runpy.run_module("hdx.scraper.unhabitat", run_name="__main__")
+# Worker processes started with spawn import this script again, so it must
+# only execute the module when run as the main script
+if __name__ == "__main__":
+    # Execute a module by its full module name
+    runpy.run_module("hdx.scraper.unhabitat", run_name="__main__")
@@ -5,17 +5,36 @@ script then creates in HDX.
 
 """
 
+import asyncio
 import logging
+import os
+from contextlib import nullcontext
+from functools import partial
 from os.path import dirname, expanduser, join
+from typing import Optional
 
 from hdx.api.configuration import Configuration
-from hdx.data.user import User
 from hdx.facades.infer_arguments import facade
 from hdx.utilities.downloader import Download
 from hdx.utilities.errors_onexit import ErrorsOnExit
 from hdx.utilities.path import temp_dir_batch
 from hdx.utilities.retriever import Retrieve
 
+from hdx.scraper.unhabitat.country_data import set_snapshot_path
+from hdx.scraper.unhabitat.instrumentation import TRACE_FORMATS, Instrumentation
+from hdx.scraper.unhabitat.iso3_cache import ISO3Cache
+from hdx.scraper.unhabitat.journal import Journal
+from hdx.scraper.unhabitat.manifest import Manifest
+from hdx.scraper.unhabitat.pipeline import Pipeline
+from hdx.scraper.unhabitat.publisher import Publisher
+from hdx.scraper.unhabitat.shard import (
+    check_shards,
+    get_shard,
+    get_shared_batch,
+    save_result,
+)
+from hdx.scraper.unhabitat.sheet_cache import SheetCache
+from hdx.scraper.unhabitat.source_cache import SourceCache
 from hdx.scraper.unhabitat.unhabitat import UNHabitat
 
 logger = logging.getLogger(__name__)
@@ -25,65 +44,325 @@ _SAVED_DATA_DIR = "saved_data"  # Keep in repo to avoid deletion in /tmp
 _UPDATED_BY_SCRIPT = "HDX Scraper: UNHabitat"
 
 
+def prepare_dataset(dataset) -> None:
+    """Add static metadata to dataset
+
+    Args:
+        dataset (Dataset): Dataset to prepare
+
+    Returns:
+        None
+    """
+    dataset.update_from_yaml(
+        path=join(dirname(__file__), "config", "hdx_dataset_static.yaml")
+    )
+    dataset["notes"] = dataset["notes"].replace(
+        "\n", "  \n"
+    )  # ensure markdown has line breaks
+
+
+def upload_dataset(
+    dataset, batch: str, instrumentation: Optional[Instrumentation] = None
+) -> None:
+    """Create or update dataset in HDX
+
+    Args:
+        dataset (Dataset): Dataset to upload
+        batch (str): Batch id shared by all datasets of the run
+        instrumentation (Optional[Instrumentation]): Instrumentation to record upload. Defaults to None.
+
+    Returns:
+        None
+    """
+    if instrumentation is None:
+        instrumentation = Instrumentation()
+    with instrumentation.span("upload", dataset["name"]) as span:
+        for resource in dataset.get_resources():
+            if resource.get_file_to_upload():
+                span.add_file(resource.get_file_to_upload())
+        dataset.create_in_hdx(
+            remove_additional_resources=True,
+            match_resource_order=False,
+            hxl_update=False,
+            updated_by_script=_UPDATED_BY_SCRIPT,
+            batch=batch,
+        )
+
+
+def filter_config_names(unhabitat, config_names, dataset_names):
+    """Get the configured datasets from which the given datasets are generated
+    keeping the order of config_names
+
+    Args:
+        unhabitat (UNHabitat): UNHabitat object
+        config_names (List[str]): Names of datasets in configuration
+        dataset_names (Iterable[str]): Names of generated datasets
+
+    Returns:
+        List[str]: Names of datasets in configuration
+    """
+    needed = {unhabitat.get_config_name(dataset_name) for dataset_name in dataset_names}
+    return [config_name for config_name in config_names if config_name in needed]
+
+
 def main(
     save: bool = True,
     use_saved: bool = False,
+    iso3_cache_path: Optional[str] = None,
+    country_snapshot_path: Optional[str] = None,
+    generate_workers: int = 1,
+    upload_workers: int = 1,
+    manifest_path: Optional[str] = None,
+    source_cache_dir: Optional[str] = None,
+    sheet_cache_dir: Optional[str] = None,
+    instrument: bool = False,
+    trace_path: Optional[str] = None,
+    trace_format: str = "json",
+    datasets: Optional[str] = None,
+    countries: Optional[str] = None,
+    pipeline: bool = False,
+    shard_index: Optional[int] = None,
+    shard_count: int = 1,
+    shard_dir: Optional[str] = None,
+    batch: Optional[str] = None,
+    coordinate: bool = False,
+    journal_dir: Optional[str] = None,
+    resume: bool = False,
 ) -> None:
     """Generate datasets and create them in HDX
 
     Args:
         save (bool): Save downloaded data. Defaults to True.
         use_saved (bool): Use saved data. Defaults to False.
+        iso3_cache_path (Optional[str]): JSON file to persist ISO3 lookups between runs. Defaults to None.
+        country_snapshot_path (Optional[str]): File to load Country data from, written if missing. Defaults to None.
+        generate_workers (int): Processes writing dataset files. Defaults to 1.
+        upload_workers (int): Threads uploading datasets to HDX. Defaults to 1.
+        manifest_path (Optional[str]): JSON file of hashes to skip unchanged datasets. Defaults to None.
+        source_cache_dir (Optional[str]): Folder to cache source files revalidated with conditional requests. Defaults to None.
+        sheet_cache_dir (Optional[str]): Folder to cache parsed sheets in Arrow format. Requires pyarrow. Defaults to None.
+        instrument (bool): Log time, rows, bytes and peak memory of each stage. Defaults to False.
+        trace_path (Optional[str]): File to write stage timings to. Implies instrument. Defaults to None.
+        trace_format (str): Format of trace file, json or chrome. Defaults to json.
+        datasets (Optional[str]): Comma separated configured datasets to generate. Defaults to None (all).
+        countries (Optional[str]): Comma separated ISO3 codes and/or world to generate. Defaults to None (all).
+        pipeline (bool): Overlap downloading, generation and upload with asyncio. Ignores generate_workers. Defaults to False.
+        shard_index (Optional[int]): Generate only this shard (0 to shard_count - 1) of the datasets. Defaults to None (all).
+        shard_count (int): Number of shards the datasets are split into. Defaults to 1.
+        shard_dir (Optional[str]): Folder, new for each run, shared by shards for batch and results. Required if sharding. Defaults to None.
+        batch (Optional[str]): HDX batch id. Defaults to None (generate one or use that of shards).
+        coordinate (bool): Only check that all shards in shard_dir completed. Defaults to False.
+        journal_dir (Optional[str]): Folder kept between runs for checkpoint journal, source and generated files. Defaults to None.
+        resume (bool): Continue the run in journal_dir, skipping completed work. Defaults to False.
 
     Returns:
         None
     """
+    # Checked before any work is done as the trace is only written at the end
+    if trace_format not in TRACE_FORMATS:
+        raise ValueError(f"Unknown trace format {trace_format}!")
+    # Imported here as it pulls in hdx.data.dataset, hxl and Country
+    from hdx.data.user import User
+
     configuration = Configuration.read()
+    set_snapshot_path(country_snapshot_path)
+    if datasets:
+        config_names = datasets.split(",")
+    else:
+        config_names = [
+            "open_spaces",
+            "urban_transport",
+            "spatial_growth_cities",
+            "housing_slums",
+            "basic_services",
+        ]
+    if countries:
+        countries = countries.split(",")
+    sharded = shard_index is not None
+    if (sharded or coordinate) and not shard_dir:
+        raise ValueError("shard_dir must be given when sharding!")
+    if resume and not journal_dir:
+        raise ValueError("journal_dir must be given when resuming!")
+    if coordinate:
+        unhabitat = UNHabitat(configuration, None, None, None)
+        dataset_names = unhabitat.get_dataset_names(config_names, countries)
+        check_shards(shard_dir, shard_count, dataset_names)
+        if source_cache_dir:
+            SourceCache(
+                source_cache_dir,
+                max_size=configuration.get("source_cache_max_size"),
+            ).evict()
+        if sheet_cache_dir:
+            SheetCache(
+                sheet_cache_dir,
+                configuration.get("sheet_cache_max_age"),
+                configuration.get("sheet_cache_max_size"),
+            ).evict()
+        return
     User.check_current_user_write_access("unhabitat-das")
 
+    folder = _USER_AGENT_LOOKUP
+    saved_dir = _SAVED_DATA_DIR
+    if sharded:
+        batch = get_shared_batch(shard_dir, batch)
+        # Shards run on one machine need their own temporary folders and, as
+        # Retrieve empties the folder it saves to, their own saved data folders
+        folder = f"{folder}-shard{shard_index}"
+        if save:
+            saved_dir = f"{saved_dir}-shard{shard_index}"
+    delete_saved = True
+    journal = None
+    if journal_dir:
+        journal = Journal(journal_dir, resume, batch)
+        # Files are kept in the journal folder for a resumed run to use
+        run_folder = nullcontext({"folder": journal_dir, "batch": journal.batch})
+        if save:
+            # Saved sources too, as Retrieve would otherwise empty the saved
+            # data folder before a resumed run could use them
+            saved_dir = join(journal_dir, _SAVED_DATA_DIR)
+            delete_saved = not resume
+            os.makedirs(saved_dir, exist_ok=True)
+    else:
+        run_folder = temp_dir_batch(folder, batch=batch)
     with ErrorsOnExit() as errors:
-        with temp_dir_batch(_USER_AGENT_LOOKUP) as info:
+        with run_folder as info:
+            batch = info["batch"]
             temp_dir = info["folder"]
             with Download() as downloader:
                 retriever = Retrieve(
                     downloader=downloader,
                     fallback_dir=temp_dir,
-                    saved_dir=_SAVED_DATA_DIR,
+                    saved_dir=saved_dir,
                     temp_dir=temp_dir,
                     save=save,
                     use_saved=use_saved,
+                    delete=delete_saved,
                 )
                 folder = info["folder"]
-                unhabitat = UNHabitat(configuration, retriever, folder, errors)
-                dataset_names = unhabitat.get_data(
-                    datasets=[
-                        "open_spaces",
-                        "urban_transport",
-                        "spatial_growth_cities",
-                        "housing_slums",
-                        "basic_services",
+                iso3_cache = ISO3Cache(iso3_cache_path)
+                manifest = Manifest(manifest_path) if manifest_path else None
+                source_cache = None
+                if source_cache_dir:
+                    source_cache = SourceCache(
+                        source_cache_dir,
+                        configuration.get("source_cache_ttl", 0),
+                        configuration.get("source_cache_max_size"),
+                        shared=sharded,
+                    )
+                sheet_cache = None
+                if sheet_cache_dir:
+                    sheet_cache = SheetCache(
+                        sheet_cache_dir,
+                        configuration.get("sheet_cache_max_age"),
+                        configuration.get("sheet_cache_max_size"),
+                        shared=sharded,
+                    )
+                instrumentation = Instrumentation(instrument or bool(trace_path))
+                unhabitat = UNHabitat(
+                    configuration,
+                    retriever,
+                    folder,
+                    errors,
+                    iso3_cache=iso3_cache,
+                    manifest=manifest,
+                    source_cache=source_cache,
+                    instrumentation=instrumentation,
+                    sheet_cache=sheet_cache,
+                    journal=journal,
+                )
+                dataset_names = unhabitat.get_dataset_names(config_names, countries)
+                if sharded:
+                    dataset_names = get_shard(dataset_names, shard_index, shard_count)
+                    shard_names = dataset_names
+                    # Only download sources of datasets of this shard
+                    config_names = filter_config_names(
+                        unhabitat, config_names, dataset_names
+                    )
+                if sharded or countries:
+                    unhabitat.select(dataset_names)
+                fetch_names = config_names
+                if journal:
+                    dataset_names = [
+                        dataset_name
+                        for dataset_name in dataset_names
+                        if not journal.is_complete(dataset_name)
                     ]
+                    config_names = filter_config_names(
+                        unhabitat, config_names, dataset_names
+                    )
+                    # Sources are not needed for datasets already generated
+                    fetch_names = filter_config_names(
+                        unhabitat,
+                        config_names,
+                        (
+                            dataset_name
+                            for dataset_name in dataset_names
+                            if not journal.is_generated(dataset_name)
+                        ),
+                    )
+                if not pipeline:
+                    # Download sources up front in parallel. Each configured
+                    # dataset is parsed when the first dataset generated from
+                    # it is needed.
+                    unhabitat.prefetch(fetch_names)
+                    if source_cache:
+                        source_cache.log_statistics()
+                logger.info(f"Number of candidate datasets: {len(dataset_names)}")
+
+                publisher = Publisher(
+                    unhabitat,
+                    prepare_dataset,
+                    partial(
+                        upload_dataset, batch=batch, instrumentation=instrumentation
+                    ),
+                    errors,
+                    manifest,
+                    journal,
                 )
-                logger.info(f"Number of datasets to upload: {len(dataset_names)}")
-
-                for dataset_name in dataset_names:
-                    dataset = unhabitat.generate_dataset(dataset_name)
-                    if dataset:
-                        dataset.update_from_yaml(
-                            path=join(
-                                dirname(__file__), "config", "hdx_dataset_static.yaml"
-                            )
-                        )
-                        dataset["notes"] = dataset["notes"].replace(
-                            "\n", "  \n"
-                        )  # ensure markdown has line breaks
-                        dataset.create_in_hdx(
-                            remove_additional_resources=True,
-                            match_resource_order=False,
-                            hxl_update=False,
-                            updated_by_script=_UPDATED_BY_SCRIPT,
-                            batch=info["batch"],
-                        )
+                if pipeline:
+                    runner = Pipeline(
+                        publisher,
+                        upload_workers,
+                        configuration.get("pipeline_queue_size", 4),
+                    )
+                    asyncio.run(runner.run(config_names, dataset_names))
+                    if source_cache:
+                        source_cache.log_statistics()
+                elif generate_workers == 1 and upload_workers == 1:
+                    publisher.publish(dataset_names)
+                else:
+                    publisher.publish_parallel(
+                        dataset_names, generate_workers, upload_workers
+                    )
+
+                iso3_cache.save()
+                iso3_cache.log_statistics()
+                if manifest:
+                    manifest.save()
+                    manifest.log_summary()
+                # Shards leave eviction to the coordinator as other shards may
+                # still be using the caches
+                if source_cache and not sharded:
+                    source_cache.evict()
+                if sheet_cache:
+                    sheet_cache.log_statistics()
+                    if not sharded:
+                        sheet_cache.evict()
+                instrumentation.log_summary()
+                if trace_path:
+                    instrumentation.save(trace_path, trace_format)
+                if sharded:
+                    save_result(
+                        shard_dir,
+                        shard_index,
+                        shard_count,
+                        batch,
+                        shard_names,
+                        sum(
+                            len(error)
+                            for error in errors.shared_errors["error"].values()
+                        ),
+                    )
 
 
 if __name__ == "__main__":
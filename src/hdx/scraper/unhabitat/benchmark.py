@@ -0,0 +1,317 @@
+"""Offline benchmark of ingest, routing and file generation
+
+Synthesizes workbooks shaped like a configured resource, runs each stage of
+the pipeline on them and records its time and peak memory. Results can be
+compared with a baseline to fail on slowdowns, eg.
+
+    python -m hdx.scraper.unhabitat.benchmark --rows 10000 100000 \
+        --output results.json --baseline baseline.json
+"""
+
+import argparse
+import json
+import logging
+import random
+import sys
+import tracemalloc
+from datetime import datetime, timezone
+from os.path import dirname, exists, join
+from platform import python_version
+from time import perf_counter
+
+from hdx.location.country import Country
+from hdx.utilities.dictandlist import write_list_to_csv
+from hdx.utilities.downloader import Download
+from hdx.utilities.loader import load_json, load_yaml
+from hdx.utilities.path import temp_dir
+from hdx.utilities.saver import save_json
+from xlsxwriter import Workbook
+
+from hdx.scraper.unhabitat.iso3_cache import ISO3Cache
+from hdx.scraper.unhabitat.router import ResourceRouter
+from hdx.scraper.unhabitat.writers import write_resource_file, write_xlsx_pandas
+
+logger = logging.getLogger(__name__)
+
+_AGGREGATES = (
+    "World",
+    "Sub-Saharan Africa",
+    "Northern Africa and Western Asia",
+    "Latin America and the Caribbean",
+    "Oceania",
+)
+# Stages faster than this in the baseline are too noisy to compare
+_MIN_SECONDS = 0.05
+
+
+def get_project_configuration():
+    return load_yaml(join(dirname(__file__), "config", "project_configuration.yaml"))
+
+
+def get_country_names(count):
+    """Get names of countries for synthetic rows, including regional aggregates
+    which only go to the world dataset
+
+    Args:
+        count (int): Number of countries
+
+    Returns:
+        List[str]: Country names
+    """
+    iso3s = sorted(Country.countriesdata()["countries"])[:count]
+    names = [Country.get_country_name_from_iso3(iso3) for iso3 in iso3s]
+    return names + list(_AGGREGATES)
+
+
+def synthesize_workbook(path, resource_info, rows, country_names, seed=0):
+    """Write workbook with the country and date headers of a configured
+    resource and random values
+
+    Args:
+        path (str): Path of XLSX to write
+        resource_info (Dict): Resource configuration
+        rows (int): Number of rows
+        country_names (List[str]): Country names to pick from
+        seed (int): Random seed. Defaults to 0.
+
+    Returns:
+        List[str]: Headers
+    """
+    date_headers = list(resource_info.get("date_header") or ())
+    headers = (
+        ["Region", resource_info["country_header"], "City"]
+        + date_headers
+        + ["Indicator", "Value", "Population"]
+    )
+    rng = random.Random(seed)
+    workbook = Workbook(path, {"constant_memory": True})
+    worksheet = workbook.add_worksheet(resource_info.get("sheet") or "Sheet1")
+    worksheet.write_row(0, 0, headers)
+    for row_number in range(1, rows + 1):
+        country_name = rng.choice(country_names)
+        row = ["Region", country_name, f"City {rng.randrange(500)}"]
+        row.extend(rng.choice((1990, 2000, 2010, 2020)) for _ in date_headers)
+        row.append("Share of area")
+        row.append(round(rng.uniform(0, 100), 6))
+        row.append(rng.randrange(1000, 10000000))
+        worksheet.write_row(row_number, 0, row)
+    workbook.close()
+    return headers
+
+
+class Benchmark:
+    """Times the stages of generating datasets from one synthetic resource.
+    Peak memory of each stage is measured with tracemalloc so times include
+    its overhead.
+
+    Args:
+        folder (str): Folder for synthetic workbook and output files
+        dataset_name (str): Name of dataset in configuration to mimic
+        resource (str): Name of resource in configuration to mimic
+        configuration (Dict): Project configuration
+        trace_memory (bool): Whether to record peak memory. Defaults to True.
+    """
+
+    def __init__(
+        self, folder, dataset_name, resource, configuration, trace_memory=True
+    ):
+        self.folder = folder
+        self.dataset_name = dataset_name
+        self.resource = resource
+        self.resource_info = configuration["datasets"][dataset_name]["resources"][
+            resource
+        ]
+        self.countries = configuration["countries"]
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    def measure(self, stage, function, *args):
+        if self.trace_memory:
+            tracemalloc.start()
+        start = perf_counter()
+        try:
+            result = function(*args)
+        finally:
+            seconds = perf_counter() - start
+            peak = None
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        self.stages[stage] = {"seconds": round(seconds, 4)}
+        if peak is not None:
+            self.stages[stage]["peak_memory_mb"] = round(peak / 1048576, 2)
+        return result
+
+    def run(self, rows, countries=200):
+        """Synthesize a workbook and time each stage on it
+
+        Args:
+            rows (int): Number of rows
+            countries (int): Number of countries. Defaults to 200.
+
+        Returns:
+            Dict: Results per stage
+        """
+        path = join(self.folder, f"benchmark_{rows}.xlsx")
+        country_names = get_country_names(countries)
+        synthesize_workbook(path, self.resource_info, rows, country_names)
+
+        def ingest():
+            with Download(user_agent="benchmark") as downloader:
+                headers, iterator = downloader.get_tabular_rows(
+                    path,
+                    sheet=self.resource_info.get("sheet"),
+                    headers=1,
+                    format="xlsx",
+                    dict_form=False,
+                )
+                return headers, list(iterator)
+
+        headers, data = self.measure("ingest", ingest)
+
+        iso3_cache = ISO3Cache()
+        country_index = headers.index(self.resource_info["country_header"])
+
+        def resolve():
+            for row in data:
+                iso3_cache.get_iso3(row[country_index])
+
+        self.measure("iso3", resolve)
+
+        router = ResourceRouter(
+            self.dataset_name,
+            self.resource,
+            self.resource_info,
+            self.countries,
+            headers,
+        )
+        self.measure("routing", router.route, iter(data), iso3_cache.get_iso3)
+
+        def write(file_format):
+            for name, dataset_rows in router.rows.items():
+                filepath = join(self.folder, f"{name}.{file_format}")
+                write_resource_file(filepath, file_format, name, dataset_rows)
+
+        def write_list():
+            for name, dataset_rows in router.rows.items():
+                filepath = join(self.folder, f"{name}_list.csv")
+                write_list_to_csv(
+                    filepath,
+                    list(dataset_rows),
+                    headers=list(dataset_rows.headers),
+                    encoding="utf-8",
+                )
+
+        def write_pandas():
+            for name, dataset_rows in router.rows.items():
+                filepath = join(self.folder, f"{name}_pandas.xlsx")
+                write_xlsx_pandas(filepath, name, dataset_rows)
+
+        self.measure("csv", write, "csv")
+        self.measure("csv_list", write_list)
+        self.measure("xlsx", write, "xlsx")
+        self.measure("xlsx_pandas", write_pandas)
+        return {
+            "countries": len(country_names),
+            "datasets": len(router.rows),
+            "stages": dict(self.stages),
+        }
+
+
+def run_benchmarks(row_counts, dataset_name, resource, trace_memory=True):
+    """Run benchmark for each number of rows
+
+    Args:
+        row_counts (List[int]): Numbers of rows
+        dataset_name (str): Name of dataset in configuration to mimic
+        resource (str): Name of resource in configuration to mimic
+        trace_memory (bool): Whether to record peak memory. Defaults to True.
+
+    Returns:
+        Dict: Results
+    """
+    configuration = get_project_configuration()
+    Country.countriesdata(use_live=False)
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": python_version(),
+        "dataset": dataset_name,
+        "resource": resource,
+        "runs": {},
+    }
+    for rows in row_counts:
+        with temp_dir(
+            "unhabitat-benchmark", delete_on_success=True, delete_on_failure=True
+        ) as folder:
+            benchmark = Benchmark(
+                folder, dataset_name, resource, configuration, trace_memory
+            )
+            results["runs"][str(rows)] = benchmark.run(rows)
+        logger.info(f"{rows} rows: {json.dumps(results['runs'][str(rows)])}")
+    return results
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Compare results with baseline
+
+    Args:
+        results (Dict): Results of run_benchmarks
+        baseline (Dict): Results of an earlier run
+        tolerance (float): Allowed fractional increase. Defaults to 0.25.
+
+    Returns:
+        List[str]: Descriptions of regressions
+    """
+    regressions = []
+    for rows, run in results["runs"].items():
+        baseline_run = baseline["runs"].get(rows)
+        if not baseline_run:
+            continue
+        for stage, measures in run["stages"].items():
+            baseline_measures = baseline_run["stages"].get(stage, {})
+            for measure, value in measures.items():
+                baseline_value = baseline_measures.get(measure)
+                if not baseline_value:
+                    continue
+                if measure == "seconds" and baseline_value < _MIN_SECONDS:
+                    continue
+                if value > baseline_value * (1 + tolerance):
+                    regressions.append(
+                        f"{rows} rows {stage} {measure}: {value} > {baseline_value}"
+                    )
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10000, 100000], help="Row counts"
+    )
+    parser.add_argument("--dataset", default="open_spaces", help="Dataset to mimic")
+    parser.add_argument("--resource", default="resource_1", help="Resource to mimic")
+    parser.add_argument("--output", help="JSON file to write results to")
+    parser.add_argument("--baseline", help="JSON file of results to compare with")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="Allowed fractional slowdown"
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true", help="Do not record peak memory"
+    )
+    args = parser.parse_args(args)
+    if args.baseline and not exists(args.baseline):
+        parser.error(f"baseline {args.baseline} does not exist")
+    logging.basicConfig(level=logging.INFO)
+    results = run_benchmarks(args.rows, args.dataset, args.resource, not args.no_memory)
+    if args.output:
+        save_json(results, args.output)
+    if args.baseline:
+        regressions = compare(results, load_json(args.baseline), args.tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
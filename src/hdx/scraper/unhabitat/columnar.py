@@ -0,0 +1,116 @@
+"""Columnar routing of resource rows to country and world datasets"""
+
+from array import array
+from itertools import compress
+
+import numpy as np
+from pandas import DataFrame, Series, unique
+
+from hdx.scraper.unhabitat.router import ResourceRouter
+from hdx.scraper.unhabitat.table import RowSubset, RowTable
+
+
+def rows_to_dataframe(headers, rows):
+    """Load rows into a DataFrame of object columns so that cell values are
+    kept exactly as they were read. The DataFrame refers to the cell values of
+    the rows rather than copying them.
+
+    Args:
+        headers (Sequence[str]): Headers of rows
+        rows (List[Sequence]): Rows
+
+    Returns:
+        DataFrame: DataFrame of rows
+    """
+    values = np.empty((len(rows), len(headers)), dtype=object)
+    if rows:
+        values[:] = rows
+    return DataFrame(values, columns=list(headers), dtype=object, copy=False)
+
+
+class ColumnarRouter(ResourceRouter):
+    """Routes the rows of one resource to the world dataset and to the country
+    datasets of the configured countries like ResourceRouter, but loads the
+    sheet into a DataFrame and works on whole columns. Country names are
+    resolved to ISO3 once per unique name, country partitions are the groupby
+    positions of the dataset name of each row and years are the unique values
+    of the date header columns. The rows and years are the same as those of
+    ResourceRouter, so the files written from them are too.
+    """
+
+    def route(self, iterator, get_iso3):
+        """Route rows to datasets. Rows are collected per dataset name in
+        self.rows and years per dataset name in self.dates.
+
+        Args:
+            iterator (Iterator[List]): Rows of resource in list form
+            get_iso3 (Callable[[str], Optional[str]]): Function mapping country name to ISO3
+
+        Returns:
+            None
+        """
+        # Rows are kept as tuples for the RowTable of the world dataset
+        rows = list(map(tuple, iterator))
+        df = rows_to_dataframe(self.headers, rows)
+        country_index = self.headers.index(self.country_header)
+        date_indices = [self.headers.index(header) for header in self.date_headers]
+        self.rows = {}
+        self.dates = {}
+        names = df.iloc[:, country_index]
+        # Rows without a country name are dropped as by ResourceRouter
+        world_mask = names.astype(bool).to_numpy()
+        if not world_mask.any():
+            return
+        date_values = df.iloc[:, date_indices].to_numpy()
+        del df
+        if not world_mask.all():
+            rows = list(compress(rows, world_mask))
+            date_values = date_values[world_mask]
+            names = names[world_mask]
+
+        iso3s = {}
+        name_targets = {}
+        for country_name in names.unique():
+            iso3 = get_iso3(country_name)
+            name = self.country_names.get(iso3)
+            if name:
+                iso3s[name] = iso3
+                name_targets[country_name] = name
+        targets = Series(names.map(name_targets).to_numpy(), dtype=object)
+        country_names = [name for name in targets.unique() if name in iso3s]
+        positions = targets.groupby(targets, sort=False).indices
+
+        if self.create_rows:
+            world_rows = self.create_rows("world")
+            for row in rows:
+                world_rows.append(row)
+            for name in country_names:
+                country_rows = self.create_rows(iso3s[name])
+                for position in positions[name]:
+                    country_rows.append(rows[position])
+                self.rows[name] = country_rows
+        else:
+            world_rows = RowTable(self.headers, rows)
+            for name in country_names:
+                indices = array("L", positions[name].tolist())
+                self.rows[name] = RowSubset(world_rows, indices)
+        self.rows[self.world_name] = world_rows
+
+        # Years are taken row by row and in header order within a row, so the
+        # first of equal values, eg. 2020 and 2020.0, is kept as by
+        # ResourceRouter
+        years = date_values.ravel()
+        year_targets = np.repeat(targets.to_numpy(), len(date_indices))
+        year_mask = years.astype(bool)
+        years = years[year_mask]
+        year_targets = year_targets[year_mask]
+        self.dates[self.world_name] = set(unique(years))
+        for name in country_names:
+            self.dates[name] = set()
+        pairs = DataFrame({"name": year_targets, "year": years}, dtype=object)
+        pairs = pairs[pairs["name"].notna()].drop_duplicates()
+        for name, year in zip(pairs["name"], pairs["year"]):
+            self.dates[name].add(year)
+        if self.fixed_dates:
+            for name in self.rows:
+                self.dates[name].update(self.fixed_dates)
@@ -0,0 +1,55 @@
+"""Loading of Country data on first lookup, optionally from a snapshot"""
+
+import logging
+import pickle
+from os.path import exists
+
+from hdx.scraper.unhabitat.storage import atomic_path
+
+logger = logging.getLogger(__name__)
+
+_snapshot_path = None
+
+
+def set_snapshot_path(path):
+    """Set file from which Country data is loaded on first lookup. If the file
+    does not exist, Country data is loaded as usual and written to it. Delete
+    the file to pick up changes to the OCHA countries feed.
+
+    Args:
+        path (Optional[str]): Path of snapshot file or None to not use one
+
+    Returns:
+        None
+    """
+    global _snapshot_path
+    _snapshot_path = path
+
+
+def get_country():
+    """Get the Country class with its data loaded. hdx.location.country is only
+    imported the first time this is called and its data is read from the
+    snapshot if one has been set and exists.
+
+    Returns:
+        Type[Country]: Country class
+    """
+    from hdx.location.country import Country
+
+    # Country only exposes loading its data from the OCHA feed or its file so
+    # the snapshot is set on the class attribute it loads into
+    if Country._countriesdata is not None:
+        return Country
+    path = _snapshot_path
+    if path and exists(path):
+        with open(path, "rb") as file:
+            Country._countriesdata = pickle.load(file)
+        logger.info(f"Loaded country data from {path}")
+        return Country
+    countriesdata = Country.countriesdata()
+    if path:
+        with atomic_path(path) as temp_path:
+            with open(temp_path, "wb") as file:
+                pickle.dump(countriesdata, file, protocol=pickle.HIGHEST_PROTOCOL)
+        logger.info(f"Saved country data to {path}")
+    return Country
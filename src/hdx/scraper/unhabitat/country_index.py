@@ -0,0 +1,126 @@
+"""Index of the datasets and files generated for the configured countries"""
+
+from hdx.scraper.unhabitat.country_data import get_country
+
+
+class DatasetTarget:
+    """What a generated dataset is made from: its configured dataset, ISO3 code
+    (or world), country name and the filename of each of its resources. The
+    country name of a country dataset is filled in by CountryIndex.get_target.
+
+    Args:
+        config_name (str): Name of dataset in configuration
+        dataset_info (Dict): Dataset configuration
+        iso3 (str): ISO3 code or world
+        country_name (Optional[str]): Country name, world or None if not yet resolved
+        filenames (Dict[str, str]): Filename without extension per resource
+    """
+
+    __slots__ = ("config_name", "dataset_info", "iso3", "country_name", "filenames")
+
+    def __init__(self, config_name, dataset_info, iso3, country_name, filenames):
+        self.config_name = config_name
+        self.dataset_info = dataset_info
+        self.iso3 = iso3
+        self.country_name = country_name
+        self.filenames = filenames
+
+
+class CountryIndex:
+    """Lookups built once from the configuration so that they are not repeated
+    per row or per dataset: the set of configured ISO3 codes, the name of the
+    dataset each configured dataset routes each ISO3 code to and a
+    DatasetTarget for every dataset that can be generated. Country names are
+    resolved when first needed so that Country data is not loaded on startup.
+
+    Args:
+        configuration (Configuration): Project configuration
+    """
+
+    def __init__(self, configuration):
+        self.countries = tuple(configuration["countries"])
+        self.iso3s = frozenset(self.countries)
+        self.country_names = {}
+        self.bucket_keys = {}
+        self.targets = {}
+        for config_name, dataset_info in configuration["datasets"].items():
+            # Datasets that are not ready for production have no resources
+            resource_infos = dataset_info.get("resources", {})
+            if dataset_info.get("global"):
+                filenames = {
+                    resource: resource_info["filename"]
+                    for resource, resource_info in resource_infos.items()
+                }
+                self.targets[config_name] = DatasetTarget(
+                    config_name, dataset_info, "world", "world", filenames
+                )
+                continue
+            bucket_keys = {}
+            for iso3 in self.countries + ("world",):
+                dataset_name = f"{config_name}_{iso3}"
+                if iso3 == "world":
+                    country_name = "world"
+                    filenames = {
+                        resource: resource_info["filename"]
+                        for resource, resource_info in resource_infos.items()
+                    }
+                else:
+                    bucket_keys[iso3] = dataset_name
+                    country_name = None
+                    filenames = {
+                        resource: f"{resource_info['filename']}_{iso3}"
+                        for resource, resource_info in resource_infos.items()
+                    }
+                self.targets[dataset_name] = DatasetTarget(
+                    config_name, dataset_info, iso3, country_name, filenames
+                )
+            self.bucket_keys[config_name] = bucket_keys
+
+    def get_target(self, dataset_name):
+        """Get what a dataset is generated from
+
+        Args:
+            dataset_name (str): Name of dataset eg. open_spaces_AFG
+
+        Returns:
+            DatasetTarget: Target of dataset
+        """
+        target = self.targets.get(dataset_name)
+        if target is None:
+            raise ValueError(f"Unknown dataset {dataset_name}!")
+        if target.country_name is None:
+            target.country_name = self.get_country_name(target.iso3)
+        return target
+
+    def get_country_name(self, iso3):
+        """Get name of country, loading Country data the first time
+
+        Args:
+            iso3 (str): ISO3 code
+
+        Returns:
+            Optional[str]: Country name
+        """
+        country_name = self.country_names.get(iso3)
+        if country_name is None:
+            country_name = get_country().get_country_name_from_iso3(iso3)
+            self.country_names[iso3] = country_name
+        return country_name
+
+    def get_dataset_names(self, config_name, countries=None):
+        """Get names of datasets generated from a configured dataset, limited
+        to the given ISO3 codes and/or world if given
+
+        Args:
+            config_name (str): Name of dataset in configuration
+            countries (Optional[Collection[str]]): ISO3 codes and/or world to include. Defaults to None (all).
+
+        Returns:
+            List[str]: Names of datasets
+        """
+        return [
+            dataset_name
+            for dataset_name, target in self.targets.items()
+            if target.config_name == config_name
+            and (countries is None or target.iso3 in countries)
+        ]
@@ -0,0 +1,118 @@
+"""Index and eviction of files kept in a cache folder"""
+
+import logging
+import os
+from os.path import exists, join
+from threading import Lock
+from time import time
+
+from hdx.utilities.loader import load_json
+from hdx.utilities.path import get_temp_dir
+
+from hdx.scraper.unhabitat.storage import atomic_save_json, file_lock
+
+logger = logging.getLogger(__name__)
+
+
+class FileCache:
+    """Base of caches that keep files in a folder along with an index.json
+    mapping each key to an entry with the file name, its size and when it was
+    last accessed. The index is rewritten atomically whenever an entry is
+    updated. evict removes files not used within max_age and then least
+    recently used files until the total size is within max_size.
+
+    If shared, the folder can be used by several processes at once, eg. shards
+    of a run. The index is then merged with the one on disk under a lock file
+    when written, so entries added by other processes are kept. evict should
+    only be called once no other process is using the folder.
+
+    Args:
+        folder (Optional[str]): Folder for cache. Defaults to None (folder_name in temp dir).
+        max_age (Optional[float]): Seconds since last use after which a file is evicted. Defaults to None (no limit).
+        max_size (Optional[int]): Maximum total bytes of cached files. Defaults to None (no limit).
+        shared (bool): Whether other processes use the folder at the same time. Defaults to False.
+    """
+
+    name = "cache"
+    folder_name = "unhabitat-cache"
+
+    def __init__(self, folder=None, max_age=None, max_size=None, shared=False):
+        if not folder:
+            folder = get_temp_dir(self.folder_name)
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.max_age = max_age
+        self.max_size = max_size
+        self.shared = shared
+        self.index_path = join(folder, "index.json")
+        self.entries = {}
+        if exists(self.index_path):
+            self.entries = load_json(self.index_path)
+        self.lock = Lock()
+
+    def get_entry(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and exists(join(self.folder, entry["file"])):
+                return dict(entry)
+        return None
+
+    def update_entry(self, key, entry, counter, **kwargs):
+        entry.update(kwargs)
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            self.entries[key] = entry
+            self.save()
+
+    def evict(self):
+        """Remove files not used within max_age and then least recently used
+        files until the cache is no larger than max_size. This should be
+        called once the files returned in the run are no longer needed.
+
+        Returns:
+            None
+        """
+        if self.max_age is None and self.max_size is None:
+            return
+        now = time()
+        with self.lock:
+            if self.shared:
+                self.merge_index()
+            total = sum(entry["size"] for entry in self.entries.values())
+            entries = sorted(self.entries.items(), key=lambda item: item[1]["accessed"])
+            for key, entry in entries:
+                expired = (
+                    self.max_age is not None and now - entry["accessed"] > self.max_age
+                )
+                oversized = self.max_size is not None and total > self.max_size
+                if not expired and not oversized:
+                    continue
+                path = join(self.folder, entry["file"])
+                if exists(path):
+                    os.remove(path)
+                del self.entries[key]
+                total -= entry["size"]
+                logger.info(f"Evicted {entry['file']} from {self.name}")
+            # Not merged with the index on disk so evicted entries stay removed
+            self.write_index()
+
+    def merge_index(self):
+        # Take entries from the index on disk that other processes have
+        # written more recently than this one
+        if not exists(self.index_path):
+            return
+        for key, entry in load_json(self.index_path).items():
+            current = self.entries.get(key)
+            if current is None or entry["accessed"] > current["accessed"]:
+                self.entries[key] = entry
+
+    def save(self):
+        if not self.shared:
+            self.write_index()
+            return
+        with file_lock(f"{self.index_path}.lock"):
+            self.merge_index()
+            self.write_index()
+
+    def write_index(self):
+        atomic_save_json(self.entries, self.index_path)
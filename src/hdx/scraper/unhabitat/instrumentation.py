@@ -0,0 +1,285 @@
+"""Per-stage timing and memory instrumentation of runs"""
+
+import logging
+import os
+import threading
+from os.path import getsize
+from time import perf_counter, time
+
+from hdx.utilities.saver import save_json
+
+try:
+    from resource import RUSAGE_SELF, getrusage
+except ImportError:  # pragma: no cover
+    getrusage = None
+
+logger = logging.getLogger(__name__)
+
+TRACE_FORMATS = ("json", "chrome")
+
+
+def get_peak_rss_mb():
+    """Get peak resident set size of process so far
+
+    Returns:
+        Optional[float]: Peak RSS in MB or None if it is not available
+    """
+    if getrusage is None:
+        return None
+    peak = getrusage(RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    if os.uname().sysname == "Darwin":
+        return round(peak / 1048576, 1)
+    return round(peak / 1024, 1)
+
+
+class Span:
+    """Timing of one stage of one dataset or resource. Rows and bytes processed
+    in the stage can be added while it runs.
+
+    Args:
+        instrumentation (Instrumentation): Instrumentation recording the span
+        stage (str): Name of stage eg. download
+        dataset (Optional[str]): Dataset name
+        resource (Optional[str]): Resource name
+    """
+
+    __slots__ = (
+        "instrumentation",
+        "stage",
+        "dataset",
+        "resource",
+        "rows",
+        "bytes",
+        "start",
+        "start_time",
+    )
+
+    def __init__(self, instrumentation, stage, dataset, resource):
+        self.instrumentation = instrumentation
+        self.stage = stage
+        self.dataset = dataset
+        self.resource = resource
+        self.rows = 0
+        self.bytes = 0
+
+    def add_rows(self, rows):
+        self.rows += rows
+
+    def add_file(self, path):
+        self.bytes += getsize(path)
+
+    def add_bytes(self, nbytes):
+        self.bytes += nbytes
+
+    def __enter__(self):
+        self.start_time = time()
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.instrumentation.record(
+            self.stage,
+            perf_counter() - self.start,
+            dataset=self.dataset,
+            resource=self.resource,
+            rows=self.rows,
+            nbytes=self.bytes,
+            start=self.start_time,
+            failed=exc_type is not None,
+        )
+        return False
+
+
+class NullSpan:
+    """Span used when instrumentation is disabled which records nothing"""
+
+    __slots__ = ()
+
+    def add_rows(self, rows):
+        pass
+
+    def add_file(self, path):
+        pass
+
+    def add_bytes(self, nbytes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = NullSpan()
+
+
+class Instrumentation:
+    """Records wall time, rows, bytes and peak RSS of the stages of a run per
+    dataset and resource. When disabled, span returns a shared object that does
+    nothing so instrumented code costs a method call per stage. Spans can be
+    recorded from multiple threads.
+
+    Args:
+        enabled (bool): Whether to record spans. Defaults to False.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.records = []
+        self.lock = threading.Lock()
+        self.origin = time()
+
+    def span(self, stage, dataset=None, resource=None):
+        """Get context manager timing a stage
+
+        Args:
+            stage (str): Name of stage eg. download
+            dataset (Optional[str]): Dataset name. Defaults to None.
+            resource (Optional[str]): Resource name. Defaults to None.
+
+        Returns:
+            Union[Span, NullSpan]: Context manager yielding span
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, stage, dataset, resource)
+
+    def record(
+        self,
+        stage,
+        seconds,
+        dataset=None,
+        resource=None,
+        rows=0,
+        nbytes=0,
+        start=None,
+        failed=False,
+    ):
+        """Record a stage that has been timed
+
+        Args:
+            stage (str): Name of stage
+            seconds (float): Wall time of stage
+            dataset (Optional[str]): Dataset name. Defaults to None.
+            resource (Optional[str]): Resource name. Defaults to None.
+            rows (int): Rows processed. Defaults to 0.
+            nbytes (int): Bytes downloaded or written. Defaults to 0.
+            start (Optional[float]): Epoch time stage started. Defaults to None (now less seconds).
+            failed (bool): Whether stage raised an exception. Defaults to False.
+
+        Returns:
+            None
+        """
+        if not self.enabled:
+            return
+        if start is None:
+            start = time() - seconds
+        record = {
+            "stage": stage,
+            "dataset": dataset,
+            "resource": resource,
+            "start": round(start - self.origin, 6),
+            "seconds": round(seconds, 6),
+            "rows": rows,
+            "bytes": nbytes,
+            "peak_rss_mb": get_peak_rss_mb(),
+            "thread": threading.current_thread().name,
+        }
+        if failed:
+            record["failed"] = True
+        with self.lock:
+            self.records.append(record)
+
+    def get_summary(self):
+        """Get totals per stage in order of first occurrence
+
+        Returns:
+            Dict[str, Dict]: Totals of count, seconds, rows, bytes and max peak RSS per stage
+        """
+        summary = {}
+        for record in self.records:
+            totals = summary.setdefault(
+                record["stage"],
+                {"count": 0, "seconds": 0.0, "rows": 0, "bytes": 0, "peak_rss_mb": 0},
+            )
+            totals["count"] += 1
+            totals["seconds"] += record["seconds"]
+            totals["rows"] += record["rows"]
+            totals["bytes"] += record["bytes"]
+            peak_rss_mb = record["peak_rss_mb"] or 0
+            totals["peak_rss_mb"] = max(totals["peak_rss_mb"], peak_rss_mb)
+        return summary
+
+    def log_summary(self, slowest=5):
+        """Log table of totals per stage and the slowest spans
+
+        Args:
+            slowest (int): Number of slowest spans to log. Defaults to 5.
+
+        Returns:
+            None
+        """
+        if not self.enabled or not self.records:
+            return
+        lines = [
+            f"{'Stage':<14}{'Count':>7}{'Seconds':>11}{'Rows':>11}{'MB':>10}{'Peak RSS MB':>13}"
+        ]
+        for stage, totals in self.get_summary().items():
+            lines.append(
+                f"{stage:<14}{totals['count']:>7}{totals['seconds']:>11.2f}"
+                f"{totals['rows']:>11}{totals['bytes'] / 1048576:>10.1f}"
+                f"{totals['peak_rss_mb']:>13.1f}"
+            )
+        records = sorted(self.records, key=lambda record: -record["seconds"])
+        lines.append("Slowest:")
+        for record in records[:slowest]:
+            name = " ".join(
+                str(record[key]) for key in ("dataset", "resource") if record[key]
+            )
+            lines.append(f"  {record['stage']} {name}: {record['seconds']:.2f}s")
+        logger.info("Run summary:\n" + "\n".join(lines))
+
+    def save(self, path, trace_format="json"):
+        """Save records as JSON or in Chrome trace event format which can be
+        loaded in chrome://tracing or Perfetto
+
+        Args:
+            path (str): Path to write to
+            trace_format (str): One of TRACE_FORMATS. Defaults to json.
+
+        Returns:
+            None
+        """
+        if trace_format not in TRACE_FORMATS:
+            raise ValueError(f"Unknown trace format {trace_format}!")
+        if trace_format == "chrome":
+            pid = os.getpid()
+            events = []
+            for record in self.records:
+                name = record["stage"]
+                if record["dataset"]:
+                    name = f"{name} {record['dataset']}"
+                args = {
+                    key: record[key]
+                    for key in ("dataset", "resource", "rows", "bytes", "peak_rss_mb")
+                }
+                events.append(
+                    {
+                        "name": name,
+                        "cat": record["stage"],
+                        "ph": "X",
+                        "ts": round(record["start"] * 1000000),
+                        "dur": round(record["seconds"] * 1000000),
+                        "pid": pid,
+                        "tid": record["thread"],
+                        "args": args,
+                    }
+                )
+            save_json({"traceEvents": events}, path)
+        else:
+            save_json(
+                {"summary": self.get_summary(), "records": self.records},
+                path,
+            )
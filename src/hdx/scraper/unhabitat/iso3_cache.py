@@ -0,0 +1,83 @@
+"""Cache of country name to ISO3 lookups"""
+
+import logging
+from os.path import exists
+from time import perf_counter
+
+from hdx.utilities.loader import load_json
+
+from hdx.scraper.unhabitat.country_data import get_country
+from hdx.scraper.unhabitat.storage import atomic_save_json
+
+logger = logging.getLogger(__name__)
+
+
+class ISO3Cache:
+    """Memoizes Country.get_iso3_country_code for a run, including names that
+    could not be matched (eg. regional aggregates) which are stored as None. If
+    a path is given, previously resolved names are loaded from it and can be
+    written back with save. Country data is only loaded on the first miss.
+
+    Args:
+        path (Optional[str]): Path of JSON file to persist cache. Defaults to None.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.iso3s = {}
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+        if path and exists(path):
+            self.iso3s = load_json(path)
+            logger.info(f"Loaded {len(self.iso3s)} ISO3 lookups from {path}")
+
+    def get_iso3(self, country_name):
+        """Get ISO3 code for country name, looking it up if it is not cached
+
+        Args:
+            country_name (str): Country name
+
+        Returns:
+            Optional[str]: ISO3 code or None if there is no match
+        """
+        try:
+            iso3 = self.iso3s[country_name]
+        except KeyError:
+            self.misses += 1
+            start = perf_counter()
+            iso3 = get_country().get_iso3_country_code(country_name)
+            self.lookup_seconds += perf_counter() - start
+            self.iso3s[country_name] = iso3
+            return iso3
+        self.hits += 1
+        return iso3
+
+    def save(self):
+        """Save cache to path if one was given
+
+        Returns:
+            None
+        """
+        if not self.path:
+            return
+        iso3s = {
+            name: iso3 for name, iso3 in self.iso3s.items() if isinstance(name, str)
+        }
+        atomic_save_json(iso3s, self.path)
+
+    def log_statistics(self):
+        """Log number of cache hits and misses
+
+        Returns:
+            None
+        """
+        total = self.hits + self.misses
+        if total == 0:
+            return
+        unmatched = sum(1 for iso3 in self.iso3s.values() if iso3 is None)
+        logger.info(
+            f"ISO3 lookups: {total}, cache hits: {self.hits} "
+            f"({self.hits / total:.1%}), misses: {self.misses}, "
+            f"unmatched names: {unmatched}"
+        )
@@ -0,0 +1,244 @@
+"""Checkpoint journal of the completed stages of a run so it can be resumed"""
+
+import json
+import logging
+import os
+from copy import deepcopy
+from os.path import exists, join
+from threading import Lock
+from time import time
+
+from hdx.utilities.uuid import get_uuid
+
+from hdx.scraper.unhabitat.storage import atomic_path
+
+logger = logging.getLogger(__name__)
+
+
+class Journal:
+    """Records in a folder each stage of a run as it completes: the source
+    files fetched for each configured dataset, the datasets parsed from them,
+    the metadata and files of each generated dataset and each dataset
+    uploaded. The journal is a JSON lines file starting with the batch, to
+    which each entry is appended as its stage completes, so recording an
+    entry takes time proportional to the entry rather than the whole run. An
+    entry cut short by an interruption is dropped when resuming.
+
+    When resuming, the batch of the interrupted run is reused, uploaded
+    datasets are skipped, generated datasets are uploaded from their journaled
+    metadata and files and source files that were fetched are not downloaded
+    again, so only the remaining tail of the run is repeated. As parsed rows
+    are only held in memory, configured datasets are parsed again if any of
+    their datasets still need generating.
+
+    Args:
+        folder (str): Folder for journal, source and generated files
+        resume (bool): Whether to continue the run in the journal. Defaults to False (start a new run).
+        batch (Optional[str]): Batch of new run. Defaults to None (generate one).
+    """
+
+    stages = ("fetched", "parsed", "generated", "uploaded")
+
+    def __init__(self, folder, resume=False, batch=None):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.path = join(folder, "journal.jsonl")
+        self.lock = Lock()
+        self.entries = {stage: {} for stage in self.stages}
+        if resume and not exists(self.path):
+            logger.info(f"No journal in {folder} to resume so starting new run")
+            resume = False
+        if resume:
+            journal_batch = self.load()
+            if batch and batch != journal_batch:
+                raise ValueError(
+                    f"Batch {batch} differs from batch {journal_batch} of journal!"
+                )
+            self.batch = journal_batch
+            logger.info(
+                f"Resuming batch {self.batch}: "
+                + ", ".join(
+                    f"{len(self.entries[stage])} {stage}" for stage in self.stages
+                )
+            )
+        else:
+            self.batch = batch or get_uuid()
+        # Rewriting the journal on resuming drops an entry cut short by an
+        # interruption, which entries appended after it would otherwise follow
+        self.save()
+
+    def load(self):
+        with open(self.path, encoding="utf-8") as file:
+            lines = file.read().splitlines()
+        batch = json.loads(lines[0])["batch"]
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning("Dropping incomplete last entry of journal")
+                break
+            self.entries[record["stage"]][record["name"]] = record["entry"]
+        return batch
+
+    def save(self):
+        with atomic_path(self.path) as temp_path:
+            with open(temp_path, "w", encoding="utf-8") as file:
+                file.write(f"{json.dumps({'batch': self.batch})}\n")
+                for stage, entries in self.entries.items():
+                    for name, entry in entries.items():
+                        file.write(self.dumps(stage, name, entry))
+
+    @staticmethod
+    def dumps(stage, name, entry):
+        record = {"stage": stage, "name": name, "entry": entry}
+        return f"{json.dumps(record)}\n"
+
+    def record(self, stage, name, entry):
+        """Add entry for a stage of a configured or generated dataset and
+        append it to the journal
+
+        Args:
+            stage (str): One of fetched, parsed, generated or uploaded
+            name (str): Name of configured or generated dataset
+            entry (Dict): What the stage covered
+
+        Returns:
+            None
+        """
+        entry["time"] = time()
+        line = self.dumps(stage, name, entry)
+        with self.lock:
+            self.entries[stage][name] = entry
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(line)
+
+    def record_fetched(self, config_name, file_paths):
+        """Record source files fetched for a configured dataset
+
+        Args:
+            config_name (str): Name of dataset in configuration
+            file_paths (Dict[str, str]): Path of source file per resource
+
+        Returns:
+            None
+        """
+        self.record("fetched", config_name, {"files": file_paths})
+
+    def get_fetched(self, config_name):
+        """Get source files fetched for a configured dataset that still exist
+
+        Args:
+            config_name (str): Name of dataset in configuration
+
+        Returns:
+            Dict[str, str]: Path of source file per resource
+        """
+        entry = self.entries["fetched"].get(config_name)
+        if not entry:
+            return {}
+        return {
+            resource: path for resource, path in entry["files"].items() if exists(path)
+        }
+
+    def record_parsed(self, config_name, dataset_names):
+        """Record datasets with rows parsed from a configured dataset
+
+        Args:
+            config_name (str): Name of dataset in configuration
+            dataset_names (Iterable[str]): Names of datasets with rows
+
+        Returns:
+            None
+        """
+        self.record("parsed", config_name, {"datasets": sorted(dataset_names)})
+
+    def record_generated(self, dataset_name, dataset):
+        """Record metadata and files of a generated dataset, which is None if
+        the dataset has no data. The metadata is copied so that changes made
+        to the dataset afterwards, eg. by prepare_dataset, are not recorded.
+
+        Args:
+            dataset_name (str): Name of dataset
+            dataset (Optional[Dataset]): Generated dataset
+
+        Returns:
+            None
+        """
+        if dataset is None:
+            self.record("generated", dataset_name, {"dataset": None})
+            return
+        resources = [
+            {"resource": deepcopy(resource.data), "file": resource.get_file_to_upload()}
+            for resource in dataset.get_resources()
+        ]
+        entry = {"dataset": deepcopy(dataset.data), "resources": resources}
+        self.record("generated", dataset_name, entry)
+
+    def is_generated(self, dataset_name):
+        """Check whether a dataset was generated with all its files still
+        present
+
+        Args:
+            dataset_name (str): Name of dataset
+
+        Returns:
+            bool: True if dataset was generated
+        """
+        entry = self.entries["generated"].get(dataset_name)
+        if not entry:
+            return False
+        return all(exists(resource["file"]) for resource in entry.get("resources", ()))
+
+    def get_generated(self, dataset_name):
+        """Get dataset from its journaled metadata and files. Check it was
+        generated with is_generated first.
+
+        Args:
+            dataset_name (str): Name of dataset
+
+        Returns:
+            Optional[Dataset]: Dataset or None if it has no data
+        """
+        from hdx.data.dataset import Dataset
+        from hdx.data.resource import Resource
+
+        entry = self.entries["generated"][dataset_name]
+        if entry["dataset"] is None:
+            return None
+        dataset = Dataset(deepcopy(entry["dataset"]))
+        for resource_entry in entry["resources"]:
+            resource = Resource(deepcopy(resource_entry["resource"]))
+            resource.set_file_to_upload(resource_entry["file"])
+            dataset.add_update_resource(resource)
+        logger.info(f"Using {dataset_name} generated in journaled run")
+        return dataset
+
+    def record_uploaded(self, dataset_name, dataset, unchanged=False):
+        """Record that a dataset was uploaded or did not need uploading as it
+        is unchanged
+
+        Args:
+            dataset_name (str): Name of dataset
+            dataset (Dataset): Uploaded dataset
+            unchanged (bool): Whether upload was skipped as unchanged. Defaults to False.
+
+        Returns:
+            None
+        """
+        entry = {"name": dataset["name"], "unchanged": unchanged}
+        self.record("uploaded", dataset_name, entry)
+
+    def is_complete(self, dataset_name):
+        """Check whether nothing remains to be done for a dataset ie. it was
+        uploaded or was generated with no data
+
+        Args:
+            dataset_name (str): Name of dataset
+
+        Returns:
+            bool: True if dataset is complete
+        """
+        if dataset_name in self.entries["uploaded"]:
+            return True
+        entry = self.entries["generated"].get(dataset_name)
+        return entry is not None and entry["dataset"] is None
@@ -0,0 +1,265 @@
+"""Manifest of source and output hashes for incremental runs"""
+
+import hashlib
+import json
+import logging
+from os.path import exists
+from zipfile import ZipFile, is_zipfile
+
+from hdx.utilities.loader import load_json
+
+from hdx.scraper.unhabitat.storage import atomic_save_json
+
+logger = logging.getLogger(__name__)
+
+
+def hash_file(path):
+    """Get SHA-256 hex digest of file contents. For XLSX, the members of the
+    zip are hashed apart from the document properties which hold the time the
+    workbook was created.
+
+    Args:
+        path (str): Path to file
+
+    Returns:
+        str: Hex digest
+    """
+    sha256 = hashlib.sha256()
+    if path.endswith(".xlsx") and is_zipfile(path):
+        with ZipFile(path) as zip_file:
+            for name in sorted(zip_file.namelist()):
+                if name == "docProps/core.xml":
+                    continue
+                sha256.update(name.encode("utf-8"))
+                sha256.update(zip_file.read(name))
+        return sha256.hexdigest()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1048576), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class Manifest:
+    """Records what previous runs downloaded and uploaded so that unchanged
+    work can be skipped. For each configured dataset, a fingerprint of its
+    configuration, the output countries and the hashes of its source files is
+    kept along with the names of the datasets generated from it. For each
+    generated dataset, the hash of its metadata and the hash and HDX url of
+    each resource file is kept.
+
+    Inputs of a configured dataset are only committed on save if all the
+    datasets generated from it that the run is responsible for were uploaded
+    or found unchanged, so a failed run is retried in full next time.
+
+    Args:
+        path (str): Path of JSON manifest file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        manifest = {}
+        if exists(path):
+            manifest = load_json(path)
+        self.inputs = manifest.get("inputs", {})
+        self.datasets = manifest.get("datasets", {})
+        self.outputs = manifest.get("outputs", {})
+        self.new_inputs = {}
+        self.new_datasets = {}
+        self.new_outputs = {}
+        self.skipped_inputs = []
+        self.skipped_datasets = []
+        self.skipped_resources = []
+
+    @staticmethod
+    def get_fingerprint(dataset_info, countries, source_paths, selected=None):
+        """Get fingerprint of the inputs of a configured dataset. If a run is
+        only responsible for some of the datasets generated from it, eg. in a
+        shard or when countries are filtered, their names are included so
+        that a run generating other datasets does not skip it.
+
+        Args:
+            dataset_info (Dict): Dataset configuration
+            countries (List[str]): ISO3 codes of countries to output
+            source_paths (List[str]): Paths of downloaded source files
+            selected (Optional[Collection[str]]): Names of datasets this run generates. Defaults to None (all).
+
+        Returns:
+            str: Fingerprint
+        """
+        inputs = {
+            "configuration": dataset_info,
+            "countries": sorted(countries),
+            "sources": [hash_file(path) for path in source_paths],
+        }
+        if selected is not None:
+            inputs["selected"] = sorted(selected)
+        inputs = json.dumps(inputs, sort_keys=True, default=str)
+        return hashlib.sha256(inputs.encode("utf-8")).hexdigest()
+
+    def inputs_unchanged(self, config_name, fingerprint):
+        """Check whether the inputs of a configured dataset are unchanged since
+        a previous run whose datasets were all uploaded
+
+        Args:
+            config_name (str): Name of dataset in configuration
+            fingerprint (str): Fingerprint from get_fingerprint
+
+        Returns:
+            bool: True if inputs are unchanged
+        """
+        if self.inputs.get(config_name) == fingerprint and config_name in self.datasets:
+            self.skipped_inputs.append(config_name)
+            return True
+        self.new_inputs[config_name] = fingerprint
+        return False
+
+    def set_dataset_names(self, config_name, dataset_names):
+        """Set names of datasets generated from a configured dataset
+
+        Args:
+            config_name (str): Name of dataset in configuration
+            dataset_names (List[str]): Names of generated datasets
+
+        Returns:
+            None
+        """
+        self.new_datasets[config_name] = sorted(dataset_names)
+
+    @staticmethod
+    def get_metadata_hash(dataset):
+        """Get hash of dataset and resource metadata excluding resource urls
+
+        Args:
+            dataset (Dataset): Generated dataset
+
+        Returns:
+            str: Hex digest
+        """
+        metadata = {key: value for key, value in dataset.data.items()}
+        metadata["resources"] = [
+            {key: value for key, value in resource.data.items() if key != "url"}
+            for resource in dataset.get_resources()
+        ]
+        metadata = json.dumps(metadata, sort_keys=True, default=str)
+        return hashlib.sha256(metadata.encode("utf-8")).hexdigest()
+
+    def outputs_unchanged(self, dataset_name, dataset):
+        """Compare the files and metadata of a generated dataset with those of
+        the previous upload. Resources whose files are unchanged are pointed at
+        their existing HDX urls rather than uploading the files again.
+
+        Args:
+            dataset_name (str): Name of generated dataset
+            dataset (Dataset): Generated dataset
+
+        Returns:
+            bool: True if the dataset does not need to be uploaded
+        """
+        previous = self.outputs.get(dataset_name, {})
+        previous_resources = previous.get("resources", {})
+        resources = {}
+        unchanged = []
+        for resource in dataset.get_resources():
+            filepath = resource.get_file_to_upload()
+            if not filepath:
+                continue
+            name = resource["name"]
+            file_hash = hash_file(filepath)
+            resources[name] = {"hash": file_hash}
+            previous_resource = previous_resources.get(name, {})
+            url = previous_resource.get("url")
+            if url and previous_resource.get("hash") == file_hash:
+                unchanged.append((resource, url))
+        metadata_hash = self.get_metadata_hash(dataset)
+        self.new_outputs[dataset_name] = {
+            "metadata": metadata_hash,
+            "resources": resources,
+        }
+        if len(unchanged) == len(resources) == len(
+            previous_resources
+        ) and metadata_hash == previous.get("metadata"):
+            for resource, url in unchanged:
+                resources[resource["name"]]["url"] = url
+            self.skipped_datasets.append(dataset_name)
+            return True
+        for resource, url in unchanged:
+            resource.file_to_upload = None
+            resource["url"] = url
+            resource["url_type"] = "upload"
+            resource["resource_type"] = "file.upload"
+            self.skipped_resources.append(f"{dataset_name}: {resource['name']}")
+        return False
+
+    def record_upload(self, dataset_name, dataset):
+        """Record the HDX urls of the resources of an uploaded dataset
+
+        Args:
+            dataset_name (str): Name of generated dataset
+            dataset (Dataset): Uploaded dataset
+
+        Returns:
+            None
+        """
+        resources = self.new_outputs[dataset_name]["resources"]
+        for resource in dataset.get_resources():
+            name = resource["name"]
+            if name in resources and resource.get("url"):
+                resources[name]["url"] = resource["url"]
+        self.new_outputs[dataset_name]["uploaded"] = True
+
+    def save(self):
+        """Commit inputs of configured datasets whose generated datasets were
+        all uploaded or unchanged and write manifest
+
+        Returns:
+            None
+        """
+        skipped_datasets = set(self.skipped_datasets)
+        for config_name, fingerprint in self.new_inputs.items():
+            dataset_names = self.new_datasets.get(config_name, [])
+            complete = True
+            for dataset_name in dataset_names:
+                if dataset_name in skipped_datasets:
+                    continue
+                if not self.new_outputs.get(dataset_name, {}).get("uploaded"):
+                    complete = False
+            for dataset_name in dataset_names:
+                outputs = self.new_outputs.get(dataset_name)
+                if outputs and (
+                    outputs.pop("uploaded", False) or dataset_name in skipped_datasets
+                ):
+                    self.outputs[dataset_name] = outputs
+            if complete:
+                self.inputs[config_name] = fingerprint
+                self.datasets[config_name] = dataset_names
+            else:
+                self.inputs.pop(config_name, None)
+        atomic_save_json(
+            {
+                "inputs": self.inputs,
+                "datasets": self.datasets,
+                "outputs": self.outputs,
+            },
+            self.path,
+        )
+
+    def log_summary(self):
+        """Log what was skipped
+
+        Returns:
+            None
+        """
+        if self.skipped_inputs:
+            logger.info(
+                f"Skipped {len(self.skipped_inputs)} configured datasets with unchanged inputs: {', '.join(self.skipped_inputs)}"
+            )
+        if self.skipped_datasets:
+            logger.info(
+                f"Skipped {len(self.skipped_datasets)} datasets with unchanged outputs: {', '.join(self.skipped_datasets)}"
+            )
+        if self.skipped_resources:
+            logger.info(
+                f"Did not reupload {len(self.skipped_resources)} unchanged resources: {', '.join(self.skipped_resources)}"
+            )
+        if not (self.skipped_inputs or self.skipped_datasets or self.skipped_resources):
+            logger.info("Nothing skipped as no unchanged inputs or outputs found")
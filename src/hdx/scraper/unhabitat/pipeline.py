@@ -0,0 +1,161 @@
+"""asyncio pipeline overlapping downloading, generation and upload"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Pipeline:
+    """Runs the stages of a run concurrently. Source files of each configured
+    dataset are downloaded in an async task. Once a configured dataset is
+    downloaded, it is put on a bounded queue from which it is parsed and the
+    datasets generated from it are prepared one at a time in a single worker
+    thread, as UNHabitat is not thread-safe. Prepared datasets are put on a
+    second bounded queue and uploaded in threads, with a semaphore limiting
+    how many uploads run at once. When a queue is full, the stage feeding it
+    waits, so only a few generated datasets are held in memory at any time.
+    Downloads of all configured datasets share one executor of max_workers
+    threads and the rows parsed from a configured dataset are freed once its
+    datasets are generated.
+    If a stage fails, the other stages are cancelled and the error is raised.
+
+    Args:
+        publisher (Publisher): Publisher preparing, uploading and recording datasets
+        upload_workers (int): Number of uploads run at once. Defaults to 1.
+        queue_size (int): Maximum items waiting between stages. Defaults to 4.
+    """
+
+    def __init__(self, publisher, upload_workers=1, queue_size=4):
+        self.publisher = publisher
+        self.unhabitat = publisher.unhabitat
+        self.journal = publisher.journal
+        self.upload_workers = upload_workers
+        self.queue_size = queue_size
+        self.uploaded = []
+
+    def needs_rows(self, dataset_names):
+        # Datasets generated in a journaled run do not need parsed rows
+        if not self.journal:
+            return True
+        return not all(
+            self.journal.is_generated(dataset_name) for dataset_name in dataset_names
+        )
+
+    async def fetch(self, executor, config_name, dataset_names, parse_queue):
+        # Only downloads run in the shared executor so that there are never
+        # more than max_workers at once and UNHabitat is updated in this thread
+        loop = asyncio.get_running_loop()
+        datasets = []
+        if self.needs_rows(dataset_names):
+            datasets = [config_name]
+            if self.journal:
+                datasets = self.unhabitat.restore_fetched(datasets, {})
+        downloads = self.unhabitat.get_downloads(datasets)
+        keys = list(downloads)
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    executor, self.unhabitat.download, key, downloads[key]
+                )
+                for key in keys
+            ),
+            return_exceptions=True,
+        )
+        self.unhabitat.add_downloads(datasets, downloads, dict(zip(keys, results)))
+        await parse_queue.put(config_name)
+
+    async def fetch_all(self, executor, config_names, names_by_config, parse_queue):
+        async with asyncio.TaskGroup() as task_group:
+            for config_name in config_names:
+                dataset_names = names_by_config.get(config_name, ())
+                task_group.create_task(
+                    self.fetch(executor, config_name, dataset_names, parse_queue)
+                )
+        await parse_queue.put(None)
+
+    async def generate_all(self, executor, names_by_config, parse_queue, upload_queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            config_name = await parse_queue.get()
+            if config_name is None:
+                break
+            dataset_names = names_by_config.get(config_name, ())
+            if self.needs_rows(dataset_names):
+                await loop.run_in_executor(
+                    executor, self.unhabitat.load_dataset, config_name
+                )
+            for dataset_name in dataset_names:
+                dataset = await loop.run_in_executor(
+                    executor, self.publisher.process_dataset, dataset_name
+                )
+                if dataset:
+                    await upload_queue.put((dataset_name, dataset))
+            await loop.run_in_executor(
+                executor, self.unhabitat.unload_dataset, config_name
+            )
+        await upload_queue.put(None)
+
+    async def upload_one(self, executor, semaphore, dataset_name, dataset):
+        loop = asyncio.get_running_loop()
+        try:
+            error = await loop.run_in_executor(
+                executor, self.publisher.upload_dataset, dataset
+            )
+            if self.publisher.finish_dataset(dataset_name, dataset, error):
+                self.uploaded.append(dataset)
+        finally:
+            semaphore.release()
+
+    async def upload_all(self, executor, upload_queue):
+        semaphore = asyncio.Semaphore(self.upload_workers)
+        async with asyncio.TaskGroup() as task_group:
+            while True:
+                # Only take a dataset off the queue once an upload slot is free
+                # so that generation waits when uploads fall behind
+                await semaphore.acquire()
+                item = await upload_queue.get()
+                if item is None:
+                    semaphore.release()
+                    break
+                task_group.create_task(self.upload_one(executor, semaphore, *item))
+
+    async def run(self, config_names, dataset_names):
+        """Download, generate and upload datasets
+
+        Args:
+            config_names (List[str]): Names of datasets in configuration
+            dataset_names (List[str]): Names of datasets to generate from them
+
+        Returns:
+            List[Dataset]: Datasets that were uploaded
+        """
+        names_by_config = {}
+        for dataset_name in dataset_names:
+            config_name = self.unhabitat.get_config_name(dataset_name)
+            names_by_config.setdefault(config_name, []).append(dataset_name)
+        parse_queue = asyncio.Queue(maxsize=self.queue_size)
+        upload_queue = asyncio.Queue(maxsize=self.queue_size)
+        with (
+            ThreadPoolExecutor(
+                max_workers=self.unhabitat.max_workers,
+                thread_name_prefix="fetch",
+            ) as fetch_executor,
+            ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="generate"
+            ) as generate_executor,
+            ThreadPoolExecutor(
+                max_workers=self.upload_workers, thread_name_prefix="upload"
+            ) as upload_executor,
+        ):
+            async with asyncio.TaskGroup() as task_group:
+                task_group.create_task(
+                    self.fetch_all(
+                        fetch_executor, config_names, names_by_config, parse_queue
+                    )
+                )
+                task_group.create_task(
+                    self.generate_all(
+                        generate_executor, names_by_config, parse_queue, upload_queue
+                    )
+                )
+                task_group.create_task(self.upload_all(upload_executor, upload_queue))
+        return self.uploaded
@@ -0,0 +1,144 @@
+"""Preparation, upload and recording of generated datasets"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Publisher:
+    """Takes generated datasets to HDX. Each dataset is prepared with static
+    metadata and skipped if it is unchanged since it was last uploaded. The
+    other datasets are uploaded, and their uploads are recorded in the
+    manifest and journal. Serial runs, parallel runs and the asyncio
+    pipeline all go through process_dataset, upload_dataset and
+    finish_dataset. Only upload_dataset may run in worker threads.
+
+    Args:
+        unhabitat (UNHabitat): UNHabitat object
+        prepare (Callable[[Dataset], None]): Function adding static metadata to dataset
+        upload (Callable[[Dataset], None]): Function creating dataset in HDX
+        errors (ErrorsOnExit): Errors object
+        manifest (Optional[Manifest]): Manifest to skip unchanged datasets. Defaults to None.
+        journal (Optional[Journal]): Journal to record uploads in. Defaults to None.
+    """
+
+    def __init__(self, unhabitat, prepare, upload, errors, manifest=None, journal=None):
+        self.unhabitat = unhabitat
+        self.prepare = prepare
+        self.upload = upload
+        self.errors = errors
+        self.manifest = manifest
+        self.journal = journal
+
+    def process_dataset(self, dataset_name, write_files=True):
+        """Generate and prepare a dataset returning None if it has no data or
+        is unchanged since it was last uploaded
+
+        Args:
+            dataset_name (str): Name of dataset
+            write_files (bool): Whether to write resource files. Defaults to True.
+
+        Returns:
+            Optional[Dataset]: Dataset to upload
+        """
+        dataset = self.unhabitat.generate_dataset(dataset_name, write_files=write_files)
+        if not dataset:
+            return None
+        self.prepare(dataset)
+        if self.manifest and self.manifest.outputs_unchanged(dataset_name, dataset):
+            if self.journal:
+                self.journal.record_uploaded(dataset_name, dataset, unchanged=True)
+            return None
+        return dataset
+
+    def upload_dataset(self, dataset):
+        """Upload a dataset returning the error if it failed rather than
+        raising it
+
+        Args:
+            dataset (Dataset): Dataset to upload
+
+        Returns:
+            Optional[Exception]: Error or None if the upload succeeded
+        """
+        try:
+            self.upload(dataset)
+        except Exception as ex:
+            return ex
+        return None
+
+    def finish_dataset(self, dataset_name, dataset, error=None):
+        """Add a failed upload to errors or record a successful one in the
+        manifest and journal
+
+        Args:
+            dataset_name (str): Name of dataset
+            dataset (Dataset): Dataset that was uploaded
+            error (Optional[Exception]): Error from upload_dataset. Defaults to None.
+
+        Returns:
+            bool: True if the dataset was uploaded
+        """
+        if error:
+            logger.error(f"Upload of {dataset['name']} failed!", exc_info=error)
+            self.errors.add(f"Could not upload dataset: {error}", dataset["name"])
+            return False
+        logger.info(f"Uploaded {dataset['name']}")
+        if self.manifest:
+            self.manifest.record_upload(dataset_name, dataset)
+        if self.journal:
+            self.journal.record_uploaded(dataset_name, dataset)
+        return True
+
+    def publish(self, dataset_names):
+        """Generate and upload datasets one at a time
+
+        Args:
+            dataset_names (List[str]): Names of datasets
+
+        Returns:
+            List[Dataset]: Datasets that were uploaded
+        """
+        uploaded = []
+        for dataset_name in dataset_names:
+            dataset = self.process_dataset(dataset_name)
+            if not dataset:
+                continue
+            error = self.upload_dataset(dataset)
+            if self.finish_dataset(dataset_name, dataset, error):
+                uploaded.append(dataset)
+        return uploaded
+
+    def publish_parallel(self, dataset_names, generate_workers, upload_workers):
+        """Generate datasets, writing their files in generate_workers processes
+        if more than one, and then upload them in upload_workers threads.
+        Results are logged in the order of the datasets.
+
+        Args:
+            dataset_names (List[str]): Names of datasets
+            generate_workers (int): Number of processes writing files
+            upload_workers (int): Number of upload threads
+
+        Returns:
+            List[Dataset]: Datasets that were uploaded
+        """
+        write_files = generate_workers == 1
+        if not write_files:
+            dataset_names = self.unhabitat.write_files(dataset_names, generate_workers)
+        datasets = {}
+        for dataset_name in dataset_names:
+            dataset = self.process_dataset(dataset_name, write_files=write_files)
+            if dataset:
+                datasets[dataset_name] = dataset
+        uploaded = []
+        with ThreadPoolExecutor(max_workers=upload_workers) as executor:
+            futures = {
+                dataset_name: executor.submit(self.upload_dataset, dataset)
+                for dataset_name, dataset in datasets.items()
+            }
+            for dataset_name, future in futures.items():
+                dataset = datasets[dataset_name]
+                if self.finish_dataset(dataset_name, dataset, future.result()):
+                    uploaded.append(dataset)
+        return uploaded
@@ -0,0 +1,109 @@
+"""Routing of resource rows to country and world datasets"""
+
+from collections.abc import Mapping
+
+from hdx.scraper.unhabitat.table import RowSubset, RowTable
+
+
+class ResourceRouter:
+    """Routes the rows of one resource to the world dataset and to the country
+    datasets of the configured countries in a single pass. The country header,
+    date headers and dataset names are resolved once on construction. Rows are
+    stored once in a RowTable for the world dataset and country datasets get
+    RowSubsets of it.
+
+    Args:
+        dataset_name (str): Name of dataset in configuration
+        resource (str): Name of resource in configuration
+        resource_info (Dict): Resource configuration
+        countries (Union[Iterable[str], Mapping[str, str]]): ISO3 codes of countries to output or mapping from them to dataset names
+        headers (Sequence[str]): Headers of resource
+        create_rows (Optional[Callable[[str], Any]]): Function taking ISO3 code (or "world") returning object with append method to receive rows. Defaults to None (RowTable and RowSubsets).
+    """
+
+    def __init__(
+        self,
+        dataset_name,
+        resource,
+        resource_info,
+        countries,
+        headers,
+        create_rows=None,
+    ):
+        self.resource = resource
+        self.headers = tuple(headers)
+        self.country_header = resource_info["country_header"]
+        self.date_headers = tuple(resource_info.get("date_header") or ())
+        if self.date_headers or "date_min" not in resource_info:
+            self.fixed_dates = ()
+        else:
+            self.fixed_dates = (resource_info["date_min"], resource_info["date_max"])
+        self.world_name = f"{dataset_name}_world"
+        if isinstance(countries, Mapping):
+            self.country_names = countries
+        else:
+            self.country_names = {iso3: f"{dataset_name}_{iso3}" for iso3 in countries}
+        self.create_rows = create_rows
+        self.rows = {}
+        self.dates = {}
+
+    def route(self, iterator, get_iso3):
+        """Route rows to datasets. Rows are collected per dataset name in
+        self.rows and years per dataset name in self.dates.
+
+        Args:
+            iterator (Iterator[List]): Rows of resource in list form
+            get_iso3 (Callable[[str], Optional[str]]): Function mapping country name to ISO3
+
+        Returns:
+            None
+        """
+        country_index = self.headers.index(self.country_header)
+        date_indices = tuple(self.headers.index(header) for header in self.date_headers)
+        country_names = self.country_names
+        create_rows = self.create_rows
+        world_rows = None
+        world_dates = set()
+        rows = {}
+        dates = {}
+        for row in iterator:
+            country_name = row[country_index]
+            if not country_name:
+                continue
+            if world_rows is None:
+                if create_rows:
+                    world_rows = create_rows("world")
+                else:
+                    world_rows = RowTable(self.headers)
+            position = len(world_rows)
+            world_rows.append(row)
+            iso3 = get_iso3(country_name)
+            name = country_names.get(iso3)
+            if name:
+                country_rows = rows.get(name)
+                if country_rows is None:
+                    if create_rows:
+                        country_rows = create_rows(iso3)
+                    else:
+                        country_rows = RowSubset(world_rows)
+                    rows[name] = country_rows
+                    dates[name] = set()
+                if create_rows:
+                    country_rows.append(row)
+                else:
+                    country_rows.indices.append(position)
+            for date_index in date_indices:
+                year = row[date_index]
+                if year:
+                    world_dates.add(year)
+                    if name:
+                        dates[name].add(year)
+
+        if world_rows is not None:
+            rows[self.world_name] = world_rows
+            dates[self.world_name] = world_dates
+        if self.fixed_dates:
+            for name in rows:
+                dates[name].update(self.fixed_dates)
+        self.rows = rows
+        self.dates = dates
@@ -0,0 +1,143 @@
+"""Splitting of a run across processes and checking that all of them completed"""
+
+import logging
+import os
+from os.path import exists, join
+from tempfile import NamedTemporaryFile
+
+from hdx.utilities.loader import load_json, load_text
+from hdx.utilities.uuid import get_uuid
+
+from hdx.scraper.unhabitat.storage import atomic_save_json
+
+logger = logging.getLogger(__name__)
+
+
+def get_shard(dataset_names, shard_index, shard_count):
+    """Get names of datasets a shard generates. Datasets are dealt out in turn
+    in the order they are given, so every shard gets a similar number of
+    country and world datasets of each configured dataset. Shards must be
+    given the same dataset names in the same order, which get_dataset_names
+    returns for the same configuration, datasets and countries.
+
+    Args:
+        dataset_names (List[str]): Names of datasets of whole run
+        shard_index (int): Index of shard from 0 to shard_count - 1
+        shard_count (int): Number of shards
+
+    Returns:
+        List[str]: Names of datasets of shard
+    """
+    if shard_count < 1:
+        raise ValueError(f"Shard count {shard_count} must be at least 1!")
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(
+            f"Shard index {shard_index} must be from 0 to {shard_count - 1}!"
+        )
+    return dataset_names[shard_index::shard_count]
+
+
+def get_shared_batch(folder, batch=None):
+    """Get the HDX batch id shared by the shards of a run. The first shard to
+    get here creates the batch file in the shard folder and the others read
+    it, so the folder must be new for each run.
+
+    Args:
+        folder (str): Shard folder shared by shards of run
+        batch (Optional[str]): Batch to use. Defaults to None (generate one).
+
+    Returns:
+        str: Batch
+    """
+    os.makedirs(folder, exist_ok=True)
+    path = join(folder, "batch.txt")
+    with NamedTemporaryFile(
+        "w", dir=folder, prefix="batch.txt.", suffix=".part", delete=False
+    ) as file:
+        file.write(batch or get_uuid())
+    temp_path = file.name
+    try:
+        # Linking fails if the file exists so only one shard creates it and
+        # it never appears partially written
+        os.link(temp_path, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(temp_path)
+    shared_batch = load_text(path, strip=True)
+    if batch and batch != shared_batch:
+        raise ValueError(f"Batch {batch} differs from batch {shared_batch} in {path}!")
+    logger.info(f"Shared BATCH = {shared_batch}")
+    return shared_batch
+
+
+def get_result_path(folder, shard_index):
+    return join(folder, f"shard_{shard_index}.json")
+
+
+def save_result(folder, shard_index, shard_count, batch, dataset_names, errors):
+    """Record that a shard has completed, writing the result to a temporary
+    file and moving it into place
+
+    Args:
+        folder (str): Shard folder shared by shards of run
+        shard_index (int): Index of shard
+        shard_count (int): Number of shards
+        batch (str): Batch used by shard
+        dataset_names (List[str]): Names of datasets of shard
+        errors (int): Number of errors the shard had
+
+    Returns:
+        None
+    """
+    result = {
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+        "batch": batch,
+        "dataset_names": dataset_names,
+        "errors": errors,
+    }
+    atomic_save_json(result, get_result_path(folder, shard_index))
+
+
+def check_shards(folder, shard_count, dataset_names):
+    """Check that every shard of a run completed without errors, that they
+    used the same batch and that together they covered the datasets of the
+    run
+
+    Args:
+        folder (str): Shard folder shared by shards of run
+        shard_count (int): Number of shards
+        dataset_names (List[str]): Names of datasets of whole run
+
+    Returns:
+        str: Batch shared by the shards
+    """
+    problems = []
+    batches = set()
+    covered = set()
+    for shard_index in range(shard_count):
+        path = get_result_path(folder, shard_index)
+        if not exists(path):
+            problems.append(f"shard {shard_index} did not complete")
+            continue
+        result = load_json(path)
+        if result["shard_count"] != shard_count:
+            problems.append(
+                f"shard {shard_index} ran with shard count {result['shard_count']}"
+            )
+        if result["errors"]:
+            problems.append(f"shard {shard_index} had {result['errors']} errors")
+        batches.add(result["batch"])
+        covered.update(result["dataset_names"])
+    if len(batches) > 1:
+        problems.append(f"shards used different batches {sorted(batches)}")
+    if not problems:
+        missing = [name for name in dataset_names if name not in covered]
+        if missing:
+            problems.append(f"no shard generated {', '.join(missing)}")
+    if problems:
+        raise ValueError(f"Sharded run incomplete: {'; '.join(problems)}!")
+    batch = batches.pop()
+    logger.info(f"All {shard_count} shards of batch {batch} completed")
+    return batch
@@ -0,0 +1,198 @@
+"""On disk cache of parsed sheets in Arrow IPC format"""
+
+import hashlib
+import importlib.util
+import json
+import logging
+from datetime import date, datetime
+from os.path import getsize, join
+from time import time
+
+from hdx.scraper.unhabitat.file_cache import FileCache
+from hdx.scraper.unhabitat.manifest import hash_file
+from hdx.scraper.unhabitat.storage import atomic_path
+
+logger = logging.getLogger(__name__)
+
+
+def get_arrow_types():
+    # Python types of cell values that can be stored and the Arrow types that
+    # give the same values back from to_pylist
+    import pyarrow
+
+    return {
+        str: pyarrow.string(),
+        int: pyarrow.int64(),
+        float: pyarrow.float64(),
+        bool: pyarrow.bool_(),
+        datetime: pyarrow.timestamp("us"),
+        date: pyarrow.date32(),
+    }
+
+
+def to_arrow_array(values, arrow_types):
+    """Convert values of a column to an Arrow array that gives the same values
+    and types back. Columns mixing types, eg. ints and floats, are stored as
+    dense unions so ints are not read back as floats.
+
+    Args:
+        values (List): Values of column
+        arrow_types (Dict[type, pyarrow.DataType]): Arrow type per Python type
+
+    Returns:
+        pyarrow.Array: Arrow array
+    """
+    import pyarrow
+
+    types = {type(value) for value in values}
+    types.discard(type(None))
+    if len(types) <= 1:
+        value_type = types.pop() if types else str
+        return pyarrow.array(values, type=arrow_types[value_type])
+    value_types = sorted(types, key=lambda value_type: value_type.__name__)
+    if type(None) in {type(value) for value in values}:
+        value_types.append(type(None))
+    codes = {value_type: code for code, value_type in enumerate(value_types)}
+    children = [[] for _ in value_types]
+    type_ids = []
+    offsets = []
+    for value in values:
+        code = codes[type(value)]
+        type_ids.append(code)
+        offsets.append(len(children[code]))
+        children[code].append(value)
+    arrays = []
+    for value_type, child in zip(value_types, children):
+        if value_type is type(None):
+            arrays.append(pyarrow.nulls(len(child)))
+        else:
+            arrays.append(pyarrow.array(child, type=arrow_types[value_type]))
+    return pyarrow.UnionArray.from_dense(
+        pyarrow.array(type_ids, type=pyarrow.int8()),
+        pyarrow.array(offsets, type=pyarrow.int32()),
+        arrays,
+    )
+
+
+class SheetCache(FileCache):
+    """Keeps sheets parsed by get_tabular_rows in a folder as uncompressed
+    Arrow IPC files so that unchanged source files are not parsed again. The
+    key of a sheet is the hash of the source file contents together with the
+    sheet, header and format options so a changed file or configuration
+    misses. Cached sheets are memory mapped and give the same headers and
+    rows, with the same value types, as get_tabular_rows. Sheets with values
+    of types that cannot be stored are not cached.
+
+    Files are written to temporary files and moved into place. evict removes
+    sheets not used within max_age and then least recently used sheets until
+    the total size is within max_size. If shared, eg. by shards of a run, the
+    index is merged with the one on disk when written.
+
+    Requires pyarrow, which is only imported when a sheet is read or written.
+    If it is not installed, the cache is disabled and get_tabular_rows is
+    always called.
+
+    Args:
+        folder (Optional[str]): Folder for cache. Defaults to None (unhabitat-sheet-cache in temp dir).
+        max_age (Optional[float]): Seconds since last use after which a sheet is evicted. Defaults to None (no limit).
+        max_size (Optional[int]): Maximum total bytes of cached sheets. Defaults to None (no limit).
+        shared (bool): Whether other processes use the folder at the same time. Defaults to False.
+    """
+
+    name = "sheet cache"
+    folder_name = "unhabitat-sheet-cache"
+    batch_size = 65536
+
+    def __init__(self, folder=None, max_age=None, max_size=None, shared=False):
+        super().__init__(folder, max_age, max_size, shared)
+        self.enabled = importlib.util.find_spec("pyarrow") is not None
+        if not self.enabled:
+            logger.warning("pyarrow is not installed so sheet cache is disabled")
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(file_path, **kwargs):
+        options = json.dumps(kwargs, sort_keys=True)
+        key = f"{hash_file(file_path)} {options}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+    def get_tabular_rows(self, downloader, file_path, **kwargs):
+        """Get headers and iterator of rows in list form of a sheet, reading
+        them from the cache if the file and options are unchanged and
+        otherwise parsing them with downloader.get_tabular_rows and caching
+        them
+
+        Args:
+            downloader (Download): Download object for parsing
+            file_path (str): Path to source file
+            **kwargs: Options for get_tabular_rows eg. sheet, headers, format
+
+        Returns:
+            Tuple[List[str], Iterator[List]]: Tuple (headers, iterator of rows)
+        """
+        kwargs["dict_form"] = False
+        if not self.enabled:
+            return downloader.get_tabular_rows(file_path, **kwargs)
+        key = self.get_key(file_path, **kwargs)
+        entry = self.get_entry(key)
+        if entry:
+            self.update_entry(key, entry, "hits", accessed=time())
+            return entry["headers"], self.read_rows(join(self.folder, entry["file"]))
+        headers, iterator = downloader.get_tabular_rows(file_path, **kwargs)
+        rows = list(iterator)
+        file = f"{key}.arrow"
+        from pyarrow import ArrowException
+
+        try:
+            size = self.write_sheet(join(self.folder, file), headers, rows)
+        except (ArrowException, KeyError, OverflowError) as ex:
+            logger.info(f"Not caching sheet of {file_path}: {ex}")
+        else:
+            entry = {"file": file, "headers": headers, "rows": len(rows), "size": size}
+            self.update_entry(key, entry, "misses", created=time(), accessed=time())
+        return headers, iter(rows)
+
+    def write_sheet(self, path, headers, rows):
+        import pyarrow
+        from pyarrow import ipc
+
+        arrow_types = get_arrow_types()
+        columns = [[] for _ in headers]
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+        arrays = [to_arrow_array(column, arrow_types) for column in columns]
+        # Columns are named by position as headers need not be unique
+        table = pyarrow.Table.from_arrays(
+            arrays, names=[str(column) for column in range(len(headers))]
+        )
+        with atomic_path(path) as temp_path:
+            with ipc.new_file(temp_path, table.schema) as writer:
+                writer.write_table(table, max_chunksize=self.batch_size)
+        return getsize(path)
+
+    def read_rows(self, path):
+        import pyarrow
+        from pyarrow import ipc
+
+        with pyarrow.memory_map(path) as source:
+            reader = ipc.open_file(source)
+            for index in range(reader.num_record_batches):
+                batch = reader.get_batch(index)
+                columns = [column.to_pylist() for column in batch.columns]
+                for row in zip(*columns):
+                    yield list(row)
+
+    def log_statistics(self):
+        """Log number of sheets read from cache and parsed
+
+        Returns:
+            None
+        """
+        total = self.hits + self.misses
+        if total == 0:
+            return
+        logger.info(
+            f"Parsed sheets: {total}, read from cache: {self.hits}, parsed: {self.misses}"
+        )
@@ -0,0 +1,139 @@
+"""On disk cache of source files revalidated with conditional requests"""
+
+import hashlib
+import logging
+from os.path import getsize, join
+from time import time
+
+from hdx.utilities.downloader import DownloadError
+
+from hdx.scraper.unhabitat.file_cache import FileCache
+from hdx.scraper.unhabitat.storage import atomic_path, file_lock
+
+logger = logging.getLogger(__name__)
+
+
+class SourceCache(FileCache):
+    """Keeps downloaded source files in a folder along with the ETag and
+    Last-Modified validators the server returned for them. A cached file that
+    is younger than the TTL is used without contacting the server. Otherwise
+    a conditional GET is made with If-None-Match and If-Modified-Since and on
+    304 Not Modified the cached file is used, so only changed files are
+    transferred. Files are written to temporary files and moved into place so
+    an interrupted run never leaves a partial file in the cache. If max_size
+    is given, evict removes least recently used files until the total size of
+    the cache is within it.
+
+    If shared, each file is fetched by one process at a time under a lock file
+    and the others then find it in the index, which is merged with the one on
+    disk when read and written. With a TTL, a file fetched by one shard is
+    used by the others without contacting the server at all.
+
+    Args:
+        folder (Optional[str]): Folder for cache. Defaults to None (unhabitat-source-cache in temp dir).
+        ttl (float): Seconds for which a cached file is used without revalidating. Defaults to 0.
+        max_size (Optional[int]): Maximum total bytes of cached files. Defaults to None (no limit).
+        shared (bool): Whether other processes use the folder at the same time. Defaults to False.
+    """
+
+    name = "source cache"
+    folder_name = "unhabitat-source-cache"
+    chunk_size = 1048576
+
+    def __init__(self, folder=None, ttl=0, max_size=None, shared=False):
+        super().__init__(folder, max_size=max_size, shared=shared)
+        self.ttl = ttl
+        self.fresh = 0
+        self.not_modified = 0
+        self.downloaded = 0
+
+    @staticmethod
+    def get_key(url, filename):
+        return hashlib.sha256(f"{url} {filename}".encode("utf-8")).hexdigest()[:16]
+
+    def download_file(self, session, url, filename, timeout=None):
+        """Get path to up to date copy of the file at url, downloading it only
+        if it is not cached or has changed on the server, along with the bytes
+        transferred, which are 0 if the cached file was used
+
+        Args:
+            session (requests.Session): Session with which to make requests
+            url (str): URL to download
+            filename (str): Filename to give cached file
+            timeout (Optional[float]): Timeout for request. Defaults to None.
+
+        Returns:
+            Tuple[str, int]: Tuple (path to cached file, bytes downloaded)
+        """
+        key = self.get_key(url, filename)
+        if not self.shared:
+            return self.fetch(session, key, url, filename, timeout)
+        with file_lock(join(self.folder, f"{key}.lock")):
+            # Another process may have fetched the file while this one waited
+            with self.lock:
+                self.merge_index()
+            return self.fetch(session, key, url, filename, timeout)
+
+    def fetch(self, session, key, url, filename, timeout):
+        entry = self.get_entry(key)
+        now = time()
+        headers = {}
+        if entry:
+            path = join(self.folder, entry["file"])
+            if now - entry["fetched"] < self.ttl:
+                logger.info(f"Using cached {filename} fetched within TTL")
+                self.update_entry(key, entry, "fresh", accessed=now)
+                return path, 0
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            response = session.get(url, headers=headers, stream=True, timeout=timeout)
+        except Exception as ex:
+            raise DownloadError(f"Download of {url} failed!") from ex
+        try:
+            if entry and response.status_code == 304:
+                logger.info(f"Using cached {filename} as it is not modified")
+                self.update_entry(key, entry, "not_modified", fetched=now, accessed=now)
+                return path, 0
+            try:
+                response.raise_for_status()
+            except Exception as ex:
+                raise DownloadError(f"Download of {url} failed!") from ex
+            file = f"{key}_{filename}"
+            path = join(self.folder, file)
+            size = self.write_atomically(response, path)
+        finally:
+            response.close()
+        logger.info(f"Downloaded {filename} into source cache")
+        entry = {
+            "url": url,
+            "file": file,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "size": size,
+        }
+        self.update_entry(key, entry, "downloaded", fetched=now, accessed=now)
+        return path, size
+
+    def write_atomically(self, response, path):
+        with atomic_path(path) as temp_path:
+            with open(temp_path, "wb") as file:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    file.write(chunk)
+        return getsize(path)
+
+    def log_statistics(self):
+        """Log number of files used from cache and downloaded
+
+        Returns:
+            None
+        """
+        total = self.fresh + self.not_modified + self.downloaded
+        if total == 0:
+            return
+        logger.info(
+            f"Source files: {total}, fresh in cache: {self.fresh}, "
+            f"not modified: {self.not_modified}, downloaded: {self.downloaded}"
+        )
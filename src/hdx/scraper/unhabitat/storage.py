@@ -0,0 +1,80 @@
+"""Atomic writing and locking of files shared between runs and processes"""
+
+import os
+from contextlib import contextmanager
+from os.path import basename, dirname, exists
+from tempfile import NamedTemporaryFile
+
+from hdx.utilities.saver import save_json
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on a file, blocking until other processes have
+    released it. Does nothing where fcntl is unavailable, eg. on Windows.
+
+    Args:
+        path (str): Path of lock file, created if it does not exist
+
+    Returns:
+        None
+    """
+    with open(path, "a") as file:
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def atomic_path(path):
+    """Get a uniquely named temporary path in the folder of path to write to,
+    moving the file into place if the block completes and removing it if it
+    raises. Readers never see a partially written file and processes writing
+    the same path at once, eg. shards on one machine, do not write to the
+    same temporary file.
+
+    Args:
+        path (str): Path the file is moved to
+
+    Returns:
+        str: Temporary path to write to
+    """
+    with NamedTemporaryFile(
+        dir=dirname(path) or ".",
+        prefix=f"{basename(path)}.",
+        suffix=".part",
+        delete=False,
+    ) as temp_file:
+        temp_path = temp_file.name
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    except BaseException:
+        if exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def atomic_save_json(object, path):
+    """Save object to JSON file, writing it to a temporary file and moving it
+    into place
+
+    Args:
+        object (Any): Python object to save
+        path (str): Path to JSON file
+
+    Returns:
+        None
+    """
+    with atomic_path(path) as temp_path:
+        save_json(object, temp_path)
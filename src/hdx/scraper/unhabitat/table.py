@@ -0,0 +1,131 @@
+"""Compact storage of resource rows for country and world datasets"""
+
+from array import array
+
+# Kinds of column by the types of their non-missing values
+STRING = "string"
+NUMBER = "number"
+OTHER = "other"
+
+
+class RowTable:
+    """Rows of one resource stored as tuples in header order sharing a single
+    header tuple rather than as a dict per row. The world dataset of a
+    resource holds the table and country datasets hold RowSubsets of it.
+    The rows encoded as CSV are kept in encoded_csv by the CSV writer so they
+    are shared by the files of all its datasets, until the files of the world
+    dataset are written, but are not pickled.
+
+    Args:
+        headers (Sequence[str]): Column headers
+        rows (Optional[List[Tuple]]): Rows. Defaults to None (empty).
+        column_kinds (Optional[Tuple[str, ...]]): Kinds of columns if known. Defaults to None.
+    """
+
+    __slots__ = ("headers", "rows", "column_kinds", "encoded_csv")
+
+    def __init__(self, headers, rows=None, column_kinds=None):
+        self.headers = tuple(headers)
+        self.rows = [] if rows is None else rows
+        self.column_kinds = column_kinds
+        self.encoded_csv = None
+
+    def append(self, row):
+        self.rows.append(tuple(row))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __eq__(self, other):
+        if not isinstance(other, (RowTable, RowSubset)):
+            return NotImplemented
+        return self.headers == other.headers and list(self) == list(other)
+
+    def __reduce__(self):
+        return RowTable, (self.headers, self.rows, self.column_kinds)
+
+    def get_column_kinds(self):
+        """Get the kind of each column: STRING if its values are all strings,
+        NUMBER if they are all ints or floats and otherwise OTHER, ignoring
+        missing values. Kinds are computed once and kept, so rows should not
+        be appended afterwards. They also hold for any RowSubset of the table.
+
+        Returns:
+            Tuple[str, ...]: Kind of each column
+        """
+        if self.column_kinds is None:
+            kinds = []
+            for column in range(len(self.headers)):
+                types = {type(row[column]) for row in self.rows}
+                types.discard(type(None))
+                if types <= {str}:
+                    kinds.append(STRING)
+                elif types <= {int, float}:
+                    kinds.append(NUMBER)
+                else:
+                    kinds.append(OTHER)
+            self.column_kinds = tuple(kinds)
+        return self.column_kinds
+
+    def to_dicts(self):
+        """Get rows as dicts
+
+        Returns:
+            List[Dict]: Rows as dicts
+        """
+        headers = self.headers
+        return [dict(zip(headers, row)) for row in self]
+
+    def to_dataframe(self):
+        """Get rows as DataFrame with types inferred as for a list of dicts
+
+        Returns:
+            DataFrame: Rows as DataFrame
+        """
+        from pandas import DataFrame
+
+        return DataFrame(list(self), columns=list(self.headers))
+
+
+class RowSubset:
+    """Rows of a RowTable selected by an array of row indices. When pickled, eg.
+    to send to a worker process, only the selected rows are sent as a
+    RowTable along with the column kinds of the whole table.
+
+    Args:
+        table (RowTable): Table of rows
+        indices (Optional[array]): Row indices. Defaults to None (empty).
+    """
+
+    __slots__ = ("table", "indices")
+
+    def __init__(self, table, indices=None):
+        self.table = table
+        self.indices = array("L") if indices is None else indices
+
+    @property
+    def headers(self):
+        return self.table.headers
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        rows = self.table.rows
+        for index in self.indices:
+            yield rows[index]
+
+    def __eq__(self, other):
+        return RowTable.__eq__(self, other)
+
+    def get_column_kinds(self):
+        return self.table.get_column_kinds()
+
+    def __reduce__(self):
+        return RowTable, (self.headers, list(self), self.get_column_kinds())
+
+    to_dicts = RowTable.to_dicts
+    to_dataframe = RowTable.to_dataframe
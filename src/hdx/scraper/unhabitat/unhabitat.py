@@ -2,129 +2,492 @@
 """UN Habitat scraper"""
 
 import logging
-from os.path import join
-
-from hdx.data.dataset import Dataset
-from hdx.data.resource import Resource
-from hdx.location.country import Country
-from hdx.utilities.dictandlist import (
-    dict_of_dicts_add,
-    dict_of_sets_add,
-    write_list_to_csv,
-)
-from pandas import DataFrame, ExcelWriter
-from slugify import slugify
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+from os.path import getsize, join
+from shutil import copyfile
+
+from hdx.utilities.dictandlist import dict_of_dicts_add, dict_of_sets_add
+from hdx.utilities.downloader import Download
+
+from hdx.scraper.unhabitat.country_index import CountryIndex
+from hdx.scraper.unhabitat.instrumentation import Instrumentation
+from hdx.scraper.unhabitat.iso3_cache import ISO3Cache
+from hdx.scraper.unhabitat.router import ResourceRouter
+from hdx.scraper.unhabitat.table import RowTable
+from hdx.scraper.unhabitat.writers import StreamingWriter, write_resource_file
 
 logger = logging.getLogger(__name__)
 
 
 class UNHabitat:
-    def __init__(self, configuration, retriever, folder, errors):
+    def __init__(
+        self,
+        configuration,
+        retriever,
+        folder,
+        errors,
+        max_workers=None,
+        iso3_cache=None,
+        streaming=None,
+        manifest=None,
+        source_cache=None,
+        instrumentation=None,
+        sheet_cache=None,
+        journal=None,
+        engine=None,
+    ):
         self.configuration = configuration
         self.retriever = retriever
         self.folder = folder
         self.errors = errors
+        if max_workers is None:
+            max_workers = configuration.get("download_workers", 4)
+        self.max_workers = max_workers
+        if iso3_cache is None:
+            iso3_cache = ISO3Cache()
+        self.iso3_cache = iso3_cache
+        if streaming is None:
+            streaming = configuration.get("streaming_output", False)
+        self.streaming = streaming
+        if engine is None:
+            engine = configuration.get("engine", "rows")
+        self.engine = engine
+        self.manifest = manifest
+        self.source_cache = source_cache
+        self.sheet_cache = sheet_cache
+        self.journal = journal
+        self.country_index = CountryIndex(configuration)
+        if instrumentation is None:
+            instrumentation = Instrumentation()
+        self.instrumentation = instrumentation
         self.data = {}
         self.dates = {}
         self.files = {}
+        self.file_paths = {}
+        self.fetched = set()
+        self.loaded = set()
+        self.selected = None
 
-    def get_data(self, datasets=None):
-        if not datasets:
-            datasets = self.configuration["datasets"]
+    def download_resource(self, url, dataset_name=None, resource=None, **kwargs):
+        with self.instrumentation.span("download", dataset_name, resource) as span:
+            path, nbytes = self.download_file(url, **kwargs)
+            span.add_bytes(nbytes)
+        return path
+
+    def download_file(self, url, **kwargs):
+        """Get path to source file at url, from saved data, the source cache
+        or by downloading it, along with the bytes transferred
+
+        Args:
+            url (str): URL to download
+            **kwargs: Options for get_filename eg. filename, format
+
+        Returns:
+            Tuple[str, int]: Tuple (path to file, bytes downloaded)
+        """
+        # Download objects keep the current response on the instance so each
+        # worker gets its own one sharing the session of the main downloader
+        downloader = Download(session=self.retriever.downloader.session)
+        try:
+            retriever = self.retriever.clone(downloader)
+            if retriever.use_saved:
+                return retriever.download_file(url, **kwargs), 0
+            if self.source_cache is None:
+                path = retriever.download_file(url, **kwargs)
+                return path, getsize(path)
+            filename, _ = retriever.get_filename(url, **kwargs)
+            path, nbytes = self.source_cache.download_file(
+                downloader.session, url, filename
+            )
+            if retriever.save:
+                copyfile(path, join(retriever.saved_dir, filename))
+            return path, nbytes
+        finally:
+            downloader.close_response()
+
+    def prefetch(self, datasets):
+        file_paths = {}
+        if self.journal:
+            datasets = self.restore_fetched(datasets, file_paths)
+        downloads = self.get_downloads(datasets)
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                key: executor.submit(self.download, key, targets)
+                for key, targets in downloads.items()
+            }
+            for key, future in futures.items():
+                try:
+                    results[key] = future.result()
+                except Exception as ex:
+                    results[key] = ex
+        file_paths.update(self.add_downloads(datasets, downloads, results))
+        return file_paths
+
+    def get_downloads(self, datasets):
+        """Get source files of configured datasets to download, each only once
+        even if it is a resource of several of them
+
+        Args:
+            datasets (List[str]): Names of datasets in configuration
+
+        Returns:
+            Dict[Tuple, Set[Tuple[str, str]]]: Dataset and resource names per url and download options
+        """
+        downloads = {}
         for dataset_name in datasets:
             dataset_info = self.configuration["datasets"][dataset_name]
-
-            resource_infos = dataset_info["resources"]
-            for resource, resource_info in resource_infos.items():
-                base_url = resource_info["base_url"]
+            for resource, resource_info in dataset_info["resources"].items():
                 if dataset_info.get("global"):
-                    file_path = self.retriever.download_file(
-                        base_url,
-                        filename=f"{resource_info['filename']}.{resource_info['format']}",
-                    )
-                    dict_of_dicts_add(self.files, dataset_name, resource, file_path)
-                    dict_of_sets_add(self.dates, dataset_name, dataset_info["date_min"])
-                    dict_of_sets_add(self.dates, dataset_name, dataset_info["date_max"])
+                    kwargs = {
+                        "filename": f"{resource_info['filename']}.{resource_info['format']}"
+                    }
                 else:
-                    headers, iterator = self.retriever.get_tabular_rows(
-                        base_url,
-                        sheet=resource_info.get("sheet"),
-                        headers=resource_info.get("header", 1),
-                        format=resource_info.get("format"),
-                        dict_form=True,
-                        encoding="utf-8",
+                    kwargs = {"format": resource_info.get("format")}
+                key = (resource_info["base_url"], tuple(kwargs.items()))
+                dict_of_sets_add(downloads, key, (dataset_name, resource))
+        return downloads
+
+    def download(self, key, targets):
+        """Download a source file from get_downloads. This is the only part of
+        fetching that can run in worker threads.
+
+        Args:
+            key (Tuple): Url and download options
+            targets (Set[Tuple[str, str]]): Dataset and resource names
+
+        Returns:
+            str: Path to downloaded file
+        """
+        return self.download_resource(key[0], *min(targets), **dict(key[1]))
+
+    def add_downloads(self, datasets, downloads, results):
+        """Record the results of downloading the source files of configured
+        datasets, adding failures to errors
+
+        Args:
+            datasets (List[str]): Names of datasets in configuration
+            downloads (Dict[Tuple, Set[Tuple[str, str]]]): Downloads from get_downloads
+            results (Dict[Tuple, Union[str, Exception]]): Path or error per download
+
+        Returns:
+            Dict[Tuple[str, str], str]: Path to file per dataset and resource name
+        """
+        file_paths = {}
+        for key, targets in downloads.items():
+            targets = sorted(targets)
+            result = results[key]
+            if isinstance(result, Exception):
+                logger.error(f"Download of {key[0]} failed!", exc_info=result)
+                for dataset_name, resource in targets:
+                    self.errors.add(
+                        f"Could not download {resource}: {result}", dataset_name
                     )
+                continue
+            for target in targets:
+                file_paths[target] = result
+        if self.journal:
+            for dataset_name in datasets:
+                self.journal.record_fetched(
+                    dataset_name,
+                    {
+                        resource: file_path
+                        for (name, resource), file_path in file_paths.items()
+                        if name == dataset_name
+                    },
+                )
+        self.file_paths.update(file_paths)
+        self.fetched.update(datasets)
+        return file_paths
+
+    def restore_fetched(self, datasets, file_paths):
+        """Add source files of configured datasets that the journal records as
+        fetched in full to file_paths
+
+        Args:
+            datasets (List[str]): Names of datasets in configuration
+            file_paths (Dict[Tuple[str, str], str]): Dictionary to add paths to
 
-                    for row in iterator:
-                        country_name = row[resource_info["country_header"]]
-                        if not country_name:
-                            continue
-                        iso3 = Country.get_iso3_country_code(country_name)
-
-                        if iso3 in self.configuration["countries"]:
-                            self.add_row_to_data_dict(
-                                f"{dataset_name}_{iso3}", resource, row
-                            )
-                            if resource_info.get("date_header"):
-                                for date_header in resource_info["date_header"]:
-                                    if row[date_header]:
-                                        dict_of_sets_add(
-                                            self.dates,
-                                            f"{dataset_name}_{iso3}",
-                                            row[date_header],
-                                        )
-                            elif "date_min" in resource_info:
-                                dict_of_sets_add(
-                                    self.dates,
-                                    f"{dataset_name}_{iso3}",
-                                    resource_info["date_min"],
-                                )
-                                dict_of_sets_add(
-                                    self.dates,
-                                    f"{dataset_name}_{iso3}",
-                                    resource_info["date_max"],
-                                )
-
-                        self.add_row_to_data_dict(
-                            f"{dataset_name}_world", resource, row
-                        )
-                        if resource_info.get("date_header"):
-                            for date_header in resource_info["date_header"]:
-                                if row[date_header]:
-                                    dict_of_sets_add(
-                                        self.dates,
-                                        f"{dataset_name}_world",
-                                        row[date_header],
-                                    )
-                        elif "date_min" in resource_info:
-                            dict_of_sets_add(
-                                self.dates,
-                                f"{dataset_name}_world",
-                                resource_info["date_min"],
-                            )
-                            dict_of_sets_add(
-                                self.dates,
-                                f"{dataset_name}_world",
-                                resource_info["date_max"],
-                            )
+        Returns:
+            List[str]: Names of datasets whose sources need fetching
+        """
+        remaining = []
+        for dataset_name in datasets:
+            resources = self.configuration["datasets"][dataset_name]["resources"]
+            fetched = self.journal.get_fetched(dataset_name)
+            if fetched.keys() != resources.keys():
+                remaining.append(dataset_name)
+                continue
+            logger.info(f"Using sources of {dataset_name} fetched in journaled run")
+            for resource, file_path in fetched.items():
+                file_paths[(dataset_name, resource)] = file_path
+                self.file_paths[(dataset_name, resource)] = file_path
+            self.fetched.add(dataset_name)
+        return remaining
 
+    def get_data(self, datasets=None):
+        if not datasets:
+            datasets = self.configuration["datasets"]
+        self.prefetch([name for name in datasets if name not in self.fetched])
+        for dataset_name in datasets:
+            self.load_dataset(dataset_name)
+        self.iso3_cache.log_statistics()
         dataset_names = sorted(self.data.keys()) + sorted(self.files.keys())
         return dataset_names
 
-    def generate_dataset(self, dataset_name):
-        if dataset_name in self.files:
-            dataset_info = self.configuration["datasets"][dataset_name]
-            iso3 = "world"
-        else:
-            dataset_info = self.configuration["datasets"][
-                dataset_name.rsplit("_", 1)[0]
+    def get_dataset_names(self, datasets=None, countries=None):
+        """Get names of datasets that can be generated from configured datasets
+        without parsing any resources. Country datasets are listed for all
+        configured countries so generate_dataset returns None for those with
+        no rows in the sources. Configured datasets without resources, which
+        are not ready for production, cannot be generated, and countries must
+        be configured ISO3 codes or world.
+
+        Args:
+            datasets (Optional[List[str]]): Names of datasets in configuration. Defaults to None (all with resources).
+            countries (Optional[List[str]]): ISO3 codes and/or world to include. Defaults to None (all).
+
+        Returns:
+            List[str]: Names of datasets
+        """
+        if not datasets:
+            datasets = [
+                config_name
+                for config_name, dataset_info in self.configuration["datasets"].items()
+                if dataset_info.get("resources")
             ]
-            iso3 = dataset_name.rsplit("_", 1)[1]
+        if countries is not None:
+            countries = frozenset(countries)
+            unknown = countries - self.country_index.iso3s - {"world"}
+            if unknown:
+                raise ValueError(f"Unknown countries {', '.join(sorted(unknown))}!")
+        dataset_names = []
+        global_names = []
+        for config_name in datasets:
+            if config_name not in self.configuration["datasets"]:
+                raise ValueError(f"Unknown dataset {config_name}!")
+            if not self.configuration["datasets"][config_name].get("resources"):
+                raise ValueError(f"Dataset {config_name} has no resources!")
+            names = self.country_index.get_dataset_names(config_name, countries)
+            if self.configuration["datasets"][config_name].get("global"):
+                global_names.extend(names)
+            else:
+                dataset_names.extend(names)
+        return sorted(dataset_names) + sorted(global_names)
+
+    def get_config_name(self, dataset_name):
+        return self.country_index.get_target(dataset_name).config_name
+
+    def select(self, dataset_names):
+        """Set the datasets this run is responsible for, eg. those of a shard
+        or of the countries asked for, so that the manifest only expects
+        those datasets to be uploaded before committing the inputs of the
+        configured datasets they are generated from
+
+        Args:
+            dataset_names (List[str]): Names of datasets
+
+        Returns:
+            None
+        """
+        self.selected = frozenset(dataset_names)
+
+    def get_selected(self, config_name):
+        """Get names of datasets generated from a configured dataset that this
+        run is responsible for
+
+        Args:
+            config_name (str): Name of dataset in configuration
+
+        Returns:
+            Optional[FrozenSet[str]]: Names of datasets or None if all are
+        """
+        if self.selected is None:
+            return None
+        return frozenset(
+            dataset_name
+            for dataset_name in self.country_index.get_dataset_names(config_name)
+            if dataset_name in self.selected
+        )
+
+    def load_dataset(self, config_name):
+        """Download and parse the resources of a configured dataset the first
+        time it is needed. Later calls for the same dataset do nothing once it
+        has been parsed. If parsing fails, the error is added to errors, any
+        rows parsed from it are dropped and it is parsed again the next time
+        it is needed.
+
+        Args:
+            config_name (str): Name of dataset in configuration
+
+        Returns:
+            None
+        """
+        if config_name in self.loaded:
+            return
+        if config_name not in self.fetched:
+            self.prefetch([config_name])
+        iso3_seconds = self.iso3_cache.lookup_seconds
+        iso3_misses = self.iso3_cache.misses
+        try:
+            names = self.parse_dataset(config_name, self.file_paths)
+        except Exception as ex:
+            logger.exception(f"Parsing of {config_name} failed!")
+            self.errors.add(f"Could not parse resources: {ex}", config_name)
+            self.unload_dataset(config_name)
+            return
+        self.loaded.add(config_name)
+        if self.journal:
+            self.journal.record_parsed(config_name, names)
+        self.instrumentation.record(
+            "iso3",
+            self.iso3_cache.lookup_seconds - iso3_seconds,
+            dataset=config_name,
+            rows=self.iso3_cache.misses - iso3_misses,
+        )
+
+    def unload_dataset(self, config_name):
+        """Free the rows parsed from a configured dataset once every dataset
+        generated from it has been generated. Datasets generated from it
+        afterwards would have no data.
+
+        Args:
+            config_name (str): Name of dataset in configuration
+
+        Returns:
+            None
+        """
+        for dataset_name in self.country_index.get_dataset_names(config_name):
+            self.data.pop(dataset_name, None)
+
+    def parse_dataset(self, dataset_name, file_paths):
+        dataset_info = self.configuration["datasets"][dataset_name]
+        resource_infos = dataset_info["resources"]
+        # Inputs are only fingerprinted if all source files were downloaded
+        # so a failed download is retried next run
+        manifest = self.manifest
+        if manifest:
+            source_paths = [
+                file_paths[(dataset_name, resource)]
+                for resource in resource_infos
+                if (dataset_name, resource) in file_paths
+            ]
+            if len(source_paths) != len(resource_infos):
+                manifest = None
+        selected = self.get_selected(dataset_name)
+        if manifest:
+            fingerprint = manifest.get_fingerprint(
+                dataset_info, self.country_index.countries, source_paths, selected
+            )
+            if manifest.inputs_unchanged(dataset_name, fingerprint):
+                logger.info(f"Skipping {dataset_name} as inputs are unchanged")
+                return set()
+        names = set()
+        bucket_keys = self.country_index.bucket_keys.get(dataset_name)
+        for resource, resource_info in resource_infos.items():
+            file_path = file_paths.get((dataset_name, resource))
+            if not file_path:
+                continue
+            if dataset_info.get("global"):
+                names.add(dataset_name)
+                dict_of_dicts_add(self.files, dataset_name, resource, file_path)
+                dict_of_sets_add(self.dates, dataset_name, dataset_info["date_min"])
+                dict_of_sets_add(self.dates, dataset_name, dataset_info["date_max"])
+            else:
+                kwargs = {
+                    "sheet": resource_info.get("sheet"),
+                    "headers": resource_info.get("header", 1),
+                    "format": resource_info.get("format"),
+                    "encoding": "utf-8",
+                }
+                if self.sheet_cache:
+                    headers, iterator = self.sheet_cache.get_tabular_rows(
+                        self.retriever.downloader, file_path, **kwargs
+                    )
+                else:
+                    headers, iterator = self.retriever.downloader.get_tabular_rows(
+                        file_path, dict_form=False, **kwargs
+                    )
+
+                if self.streaming:
+                    create_rows = partial(
+                        self.create_writer, dataset_name, resource, headers
+                    )
+                else:
+                    create_rows = None
+                if self.engine == "columnar":
+                    # pandas is only imported if the columnar engine is used
+                    from hdx.scraper.unhabitat.columnar import ColumnarRouter
+
+                    router_class = ColumnarRouter
+                else:
+                    router_class = ResourceRouter
+                router = router_class(
+                    dataset_name,
+                    resource,
+                    resource_info,
+                    bucket_keys,
+                    headers,
+                    create_rows,
+                )
+                # Rows are read lazily so parsing is included in routing
+                with self.instrumentation.span("route", dataset_name, resource) as span:
+                    try:
+                        router.route(iterator, self.iso3_cache.get_iso3)
+                    finally:
+                        if self.streaming:
+                            for writer in router.rows.values():
+                                writer.close()
+                    span.add_rows(len(router.rows.get(router.world_name, ())))
+                for name, rows in router.rows.items():
+                    names.add(name)
+                    self.add_rows_to_data_dict(name, resource, rows)
+                    dates = router.dates.get(name)
+                    if dates:
+                        self.dates.setdefault(name, set()).update(dates)
+        if manifest:
+            if selected is None:
+                manifest.set_dataset_names(dataset_name, names)
+            else:
+                manifest.set_dataset_names(dataset_name, names & selected)
+        return names
+
+    def generate_dataset(self, dataset_name, write_files=True):
+        """Generate dataset and its resource files. If there is a journal, a
+        dataset it records as generated is used instead and newly generated
+        datasets are recorded in it.
+
+        Args:
+            dataset_name (str): Name of dataset
+            write_files (bool): Whether to write resource files. Defaults to True.
+
+        Returns:
+            Optional[Dataset]: Dataset or None if it has no data
+        """
+        if not self.journal:
+            return self.create_dataset(dataset_name, write_files)
+        if self.journal.is_generated(dataset_name):
+            return self.journal.get_generated(dataset_name)
+        dataset = self.create_dataset(dataset_name, write_files)
+        self.journal.record_generated(dataset_name, dataset)
+        return dataset
+
+    def create_dataset(self, dataset_name, write_files=True):
+        from hdx.data.dataset import Dataset
+        from slugify import slugify
+
+        self.load_dataset(self.get_config_name(dataset_name))
+        if dataset_name not in self.data and dataset_name not in self.files:
+            return None
+        target = self.country_index.get_target(dataset_name)
+        dataset_info = target.dataset_info
+        iso3 = target.iso3
+        country_name = target.country_name
         if iso3 == "world":
-            country_name = "world"
             title = dataset_info["title"]
         else:
-            country_name = Country.get_country_name_from_iso3(iso3)
             title = f"{country_name} - {dataset_info['title']}"
         dataset = Dataset({"name": slugify(dataset_name), "title": title})
         dataset["notes"] = dataset_info["notes"]
@@ -155,51 +518,113 @@ class UNHabitat:
                     dataset,
                     resource_info,
                     resource_info["format"],
+                    target.filenames[resource],
                     filepath=filepaths[resource],
                 )
             return dataset
 
         for resource, resource_info in resource_infos.items():
             rows = self.data[dataset_name].get(resource)
-            if rows:
-                self.generate_resource(
-                    dataset, resource_info, "csv", iso3=iso3, rows=rows
-                )
-                self.generate_resource(
-                    dataset, resource_info, "xlsx", iso3=iso3, rows=rows
-                )
+            if rows is not None:
+                for file_format in ("csv", "xlsx"):
+                    self.generate_resource(
+                        dataset,
+                        resource_info,
+                        file_format,
+                        target.filenames[resource],
+                        rows=rows,
+                        write_file=write_files,
+                    )
+                # The world dataset holds the table and sorts after the
+                # country datasets sharing its encoded CSV, so it is not
+                # needed once the world files are written
+                if isinstance(rows, RowTable):
+                    rows.encoded_csv = None
         return dataset
 
+    def write_files(self, dataset_names, max_workers):
+        """Write the CSV and XLSX files of the given datasets in a process pool,
+        first loading any configured datasets that have not been. Datasets
+        whose files could not be written are reported to errors.
+
+        Args:
+            dataset_names (List[str]): Names of datasets
+            max_workers (int): Number of worker processes
+
+        Returns:
+            List[str]: Names of datasets whose files were all written
+        """
+        jobs = {}
+        for dataset_name in dataset_names:
+            if self.journal and self.journal.is_generated(dataset_name):
+                continue
+            self.load_dataset(self.get_config_name(dataset_name))
+            if dataset_name not in self.data:
+                continue
+            filenames = self.country_index.get_target(dataset_name).filenames
+            for resource, rows in self.data[dataset_name].items():
+                if isinstance(rows, StreamingWriter):
+                    continue
+                filename = filenames[resource]
+                for file_format in ("csv", "xlsx"):
+                    filepath = join(self.folder, f"{filename}.{file_format}")
+                    job = (filepath, file_format, filename, rows)
+                    jobs.setdefault(dataset_name, []).append(job)
+
+        written = []
+        span = self.instrumentation.span("write_files")
+        # Workers are not forked as this process has live threads, eg. of the
+        # HTTP connection pool, and forking them can deadlock
+        executor = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=get_context("spawn")
+        )
+        with span, executor:
+            futures = {
+                dataset_name: [
+                    executor.submit(write_resource_file, *job) for job in dataset_jobs
+                ]
+                for dataset_name, dataset_jobs in jobs.items()
+            }
+            for dataset_name in dataset_names:
+                try:
+                    for future in futures.get(dataset_name, []):
+                        future.result()
+                except Exception as ex:
+                    logger.exception(f"Writing files of {dataset_name} failed!")
+                    self.errors.add(f"Could not write files: {ex}", dataset_name)
+                    continue
+                written.append(dataset_name)
+                for job in jobs.get(dataset_name, []):
+                    span.add_file(job[0])
+        return written
+
+    def create_writer(self, config_name, resource, headers, iso3):
+        target = self.country_index.get_target(f"{config_name}_{iso3}")
+        return StreamingWriter(self.folder, target.filenames[resource], headers)
+
     def generate_resource(
-        self, dataset, resource_info, file_format, iso3=None, rows=None, filepath=None
+        self,
+        dataset,
+        resource_info,
+        file_format,
+        filename,
+        rows=None,
+        filepath=None,
+        write_file=True,
     ):
-        if filepath:
-            filename = resource_info["filename"]
-        if rows:
-            headers = list(rows[0].keys())
-            filename = f"{resource_info['filename']}_{iso3}"
-            if iso3 == "world":
-                filename = resource_info["filename"]
+        from hdx.data.resource import Resource
+
+        if isinstance(rows, StreamingWriter):
+            filepath = rows.paths[file_format]
+        elif rows is not None:
             filepath = join(self.folder, f"{filename}.{file_format}")
-            if file_format == "csv":
-                write_list_to_csv(filepath, rows, columns=headers, encoding="utf-8")
-            if file_format == "xlsx":
-                df = DataFrame(rows)
-                writer = ExcelWriter(filepath, engine="xlsxwriter")
-                df.to_excel(writer, sheet_name=filename[:24], index=False)
-                float_headers = df.select_dtypes(include=["float64"]).columns
-                if len(float_headers) > 0:
-                    workbook = writer.book
-                    worksheet = writer.sheets[filename[:24]]
-                    num_format = workbook.add_format({"num_format": "0.0"})
-                    for header in float_headers:
-                        worksheet.set_column(
-                            headers.index(header),
-                            headers.index(header),
-                            None,
-                            num_format,
-                        )
-                writer.close()
+            if write_file:
+                with self.instrumentation.span(
+                    f"write_{file_format}", dataset["name"], filename
+                ) as span:
+                    write_resource_file(filepath, file_format, filename, rows)
+                    span.add_rows(len(rows))
+                    span.add_file(filepath)
         resource = Resource(
             {
                 "name": f"{filename} ({file_format})",
@@ -212,14 +637,6 @@ class UNHabitat:
         dataset.add_update_resource(resource)
         return resource
 
-    def add_row_to_data_dict(self, dataset_name, resource, row):
-        if dataset_name not in self.data:
-            self.data[dataset_name] = {resource: [row]}
-            return
-
-        if resource not in self.data[dataset_name]:
-            self.data[dataset_name][resource] = [row]
-            return
-
-        self.data[dataset_name][resource].append(row)
-        return
+    def add_rows_to_data_dict(self, dataset_name, resource, rows):
+        # Each resource is routed once so a dataset never gets a resource twice
+        self.data.setdefault(dataset_name, {})[resource] = rows
@@ -0,0 +1,495 @@
+"""Incremental writers for country and world resource files"""
+
+import csv
+import pickle
+from array import array
+from datetime import date, datetime
+from itertools import accumulate
+from math import isinf, isnan
+from os.path import join
+from tempfile import TemporaryFile
+from types import SimpleNamespace
+
+from xlsxwriter import Workbook
+
+from hdx.scraper.unhabitat.table import NUMBER, OTHER, STRING, RowTable
+
+# Formats pandas uses when writing a DataFrame with to_excel
+_HEADER_FORMAT = {"bold": True, "border": 1, "align": "center", "valign": "top"}
+_FLOAT_FORMAT = {"num_format": "0.0"}
+_DATETIME_FORMAT = {"num_format": "YYYY-MM-DD HH:MM:SS"}
+_DATE_FORMAT = {"num_format": "YYYY-MM-DD"}
+
+
+def csv_cell(value):
+    """Convert value to the text write_list_to_csv outputs for it
+
+    Args:
+        value (Any): Cell value
+
+    Returns:
+        str: Cell text
+    """
+    if value is None:
+        return ""
+    return str(value)
+
+
+def get_csv_headers(headers):
+    """Get headers as write_list_to_csv outputs them: frictionless names
+    blank headers field1, field2 etc. by position and gives later duplicates
+    the first free name of name2, name3 etc.
+
+    Args:
+        headers (Sequence[str]): Column headers
+
+    Returns:
+        List[str]: Headers to write
+    """
+    csv_headers = []
+    used = set()
+    for number, header in enumerate(headers, 1):
+        header = header or f"field{number}"
+        csv_header = header
+        suffix = 2
+        while csv_header in used:
+            csv_header = f"{header}{suffix}"
+            suffix += 1
+        csv_headers.append(csv_header)
+        used.add(csv_header)
+    return csv_headers
+
+
+class EncodedCsv:
+    """Rows of a RowTable encoded once as UTF-8 CSV lines in one buffer, with
+    the offset at which each row's line starts, so that the world file and
+    every country file of a resource are written from the same bytes without
+    serializing any row again. Lines are produced by csv.writer, which
+    writes the same text as write_list_to_csv, and rows with no values are
+    encoded as empty lines as write_list_to_csv drops them.
+
+    Args:
+        table (RowTable): Rows to encode
+    """
+
+    __slots__ = ("header", "buffer", "offsets")
+
+    def __init__(self, table):
+        lines = []
+        writer = csv.writer(SimpleNamespace(write=lines.append))
+        writer.writerow(get_csv_headers(table.headers))
+        self.header = lines.pop().encode("utf-8")
+        writer.writerows(table.rows)
+        # csv.writer writes None and "" alike so rows with no values give
+        # this line, except that a single empty field is quoted
+        column_count = len(table.headers)
+        if column_count == 1:
+            empty_line = '""\r\n'
+        else:
+            empty_line = f"{',' * (column_count - 1)}\r\n"
+        lines = ["" if line == empty_line else line for line in lines]
+        text = "".join(lines)
+        if text.isascii():
+            self.buffer = text.encode("ascii")
+            lengths = map(len, lines)
+        else:
+            encoded = [line.encode("utf-8") for line in lines]
+            self.buffer = b"".join(encoded)
+            lengths = map(len, encoded)
+        self.offsets = array("Q", accumulate(lengths, initial=0))
+
+    def get_lines(self, indices):
+        """Get the encoded lines of rows as views of the buffer, joining the
+        lines of consecutive rows into a single view
+
+        Args:
+            indices (Iterable[int]): Row indices
+
+        Returns:
+            List[memoryview]: Views of buffer
+        """
+        view = memoryview(self.buffer)
+        offsets = self.offsets
+        lines = []
+        start = end = None
+        for index in indices:
+            if offsets[index] != end:
+                if start is not None:
+                    lines.append(view[start:end])
+                start = offsets[index]
+            end = offsets[index + 1]
+        if start is not None:
+            lines.append(view[start:end])
+        return lines
+
+    def write(self, filepath, indices=None):
+        """Write header and the lines of the given rows to CSV in one write
+
+        Args:
+            filepath (str): Path to write to
+            indices (Optional[Iterable[int]]): Row indices. Defaults to None (all).
+
+        Returns:
+            None
+        """
+        with open(filepath, "wb") as file:
+            if indices is None:
+                file.write(self.header + self.buffer)
+            else:
+                file.write(self.header + b"".join(self.get_lines(indices)))
+
+
+def get_encoded_csv(table):
+    """Get rows of table encoded as CSV, encoding them the first time. As with
+    column kinds, rows should not be appended afterwards.
+
+    Args:
+        table (RowTable): Table of rows
+
+    Returns:
+        EncodedCsv: Encoded rows
+    """
+    if table.encoded_csv is None:
+        table.encoded_csv = EncodedCsv(table)
+    return table.encoded_csv
+
+
+def is_float_column(types):
+    """Check whether pandas would read a column whose values have the given
+    types as float64 ie. all values are numbers or missing with at least one
+    float or a mix of integers and missing values.
+
+    Args:
+        types (Set[type]): Types of values in column
+
+    Returns:
+        bool: True if column would be float64
+    """
+    if not types <= {float, int, type(None)}:
+        return False
+    return float in types or (int in types and type(None) in types)
+
+
+def write_csv(filepath, rows):
+    """Write rows to CSV from the lines of their table encoded once by
+    EncodedCsv, producing the same bytes as write_list_to_csv
+
+    Args:
+        filepath (str): Path to write to
+        rows (Union[RowTable, RowSubset]): Rows to write
+
+    Returns:
+        None
+    """
+    # write_list_to_csv writes no file when there are no rows
+    if len(rows) == 0:
+        return
+    if isinstance(rows, RowTable):
+        get_encoded_csv(rows).write(filepath)
+    else:
+        get_encoded_csv(rows.table).write(filepath, rows.indices)
+
+
+def write_xlsx_pandas(filepath, sheet_name, rows):
+    """Write rows to XLSX using pandas, formatting float columns to one decimal
+    place. This is how files were written before write_xlsx_table and is
+    kept as the reference it is compared with in tests and benchmarks.
+
+    Args:
+        filepath (str): Path to write to
+        sheet_name (str): Name of sheet (truncated to 24 characters)
+        rows (Union[RowTable, RowSubset]): Rows to write
+
+    Returns:
+        None
+    """
+    # pandas is slow to import so is only imported when it is used
+    from pandas import ExcelWriter
+
+    df = rows.to_dataframe()
+    headers = list(df.columns)
+    sheet_name = sheet_name[:24]
+    writer = ExcelWriter(filepath, engine="xlsxwriter")
+    df.to_excel(writer, sheet_name=sheet_name, index=False)
+    float_headers = df.select_dtypes(include=["float64"]).columns
+    if len(float_headers) > 0:
+        workbook = writer.book
+        worksheet = writer.sheets[sheet_name]
+        num_format = workbook.add_format(_FLOAT_FORMAT)
+        for header in float_headers:
+            worksheet.set_column(
+                headers.index(header),
+                headers.index(header),
+                None,
+                num_format,
+            )
+    writer.close()
+
+
+def write_xlsx_table(filepath, sheet_name, rows):
+    """Write rows straight to XLSX with xlsxwriter in constant memory mode,
+    producing the same cells and formats as write_xlsx_pandas. The kinds of
+    columns are computed once per resource by get_column_kinds so that
+    columns of only strings or only numbers are written with the matching
+    xlsxwriter method. Float columns are found before writing as in constant
+    memory mode a column format only applies to cells written after it is
+    set.
+
+    Args:
+        filepath (str): Path to write to
+        sheet_name (str): Name of sheet (truncated to 24 characters)
+        rows (Union[RowTable, RowSubset]): Rows to write
+
+    Returns:
+        None
+    """
+    kinds = rows.get_column_kinds()
+    string_columns = [column for column, kind in enumerate(kinds) if kind == STRING]
+    number_columns = [column for column, kind in enumerate(kinds) if kind == NUMBER]
+    other_columns = [column for column, kind in enumerate(kinds) if kind == OTHER]
+    rows_list = list(rows)
+
+    workbook = Workbook(filepath, {"constant_memory": True})
+    worksheet = workbook.add_worksheet(sheet_name[:24])
+    formats = CellFormats(workbook)
+    for column in number_columns + other_columns:
+        if is_float_column({type(row[column]) for row in rows_list}):
+            worksheet.set_column(column, column, None, formats.get_float_format())
+    header_format = workbook.add_format(_HEADER_FORMAT)
+    for column, header in enumerate(rows.headers):
+        worksheet.write_string(0, column, header, header_format)
+    write_string = worksheet.write_string
+    write_number = worksheet.write_number
+    for row_number, row in enumerate(rows_list, 1):
+        for column in string_columns:
+            value = row[column]
+            if not value:
+                continue
+            # Leave strings that could be formulas or urls to write
+            if ":" in value or value.startswith(("=", "{")):
+                worksheet.write(row_number, column, value)
+            else:
+                write_string(row_number, column, value)
+        for column in number_columns:
+            value = row[column]
+            if value is None:
+                continue
+            if type(value) is float:
+                if isnan(value):
+                    continue
+                if isinf(value):
+                    write_string(row_number, column, "inf" if value > 0 else "-inf")
+                    continue
+            write_number(row_number, column, value)
+        for column in other_columns:
+            write_cell(worksheet, formats, row_number, column, row[column])
+    workbook.close()
+
+
+def write_resource_file(filepath, file_format, sheet_name, rows):
+    """Write rows to CSV or XLSX file
+
+    Args:
+        filepath (str): Path to write to
+        file_format (str): csv or xlsx
+        sheet_name (str): Name of sheet for XLSX
+        rows (Union[RowTable, RowSubset]): Rows to write
+
+    Returns:
+        str: Path written to
+    """
+    if file_format == "csv":
+        write_csv(filepath, rows)
+    elif file_format == "xlsx":
+        write_xlsx_table(filepath, sheet_name, rows)
+    return filepath
+
+
+class CellFormats:
+    """Formats of a workbook for cells that pandas formats, created when first
+    needed
+
+    Args:
+        workbook (Workbook): Workbook
+    """
+
+    __slots__ = ("workbook", "float_format", "datetime_format", "date_format")
+
+    def __init__(self, workbook):
+        self.workbook = workbook
+        self.float_format = None
+        self.datetime_format = None
+        self.date_format = None
+
+    def get_float_format(self):
+        if self.float_format is None:
+            self.float_format = self.workbook.add_format(_FLOAT_FORMAT)
+        return self.float_format
+
+    def get_datetime_format(self):
+        if self.datetime_format is None:
+            self.datetime_format = self.workbook.add_format(_DATETIME_FORMAT)
+        return self.datetime_format
+
+    def get_date_format(self):
+        if self.date_format is None:
+            self.date_format = self.workbook.add_format(_DATE_FORMAT)
+        return self.date_format
+
+
+def write_cell(worksheet, formats, row_number, column, value):
+    """Write value to cell as pandas to_excel would, leaving missing values
+    blank
+
+    Args:
+        worksheet (Worksheet): Worksheet
+        formats (CellFormats): Formats of workbook
+        row_number (int): Row number
+        column (int): Column number
+        value (Any): Cell value
+
+    Returns:
+        None
+    """
+    if value is None or value == "":
+        return
+    if isinstance(value, float):
+        if isnan(value):
+            return
+        if isinf(value):
+            value = "inf" if value > 0 else "-inf"
+    if isinstance(value, datetime):
+        worksheet.write_datetime(
+            row_number, column, value, formats.get_datetime_format()
+        )
+    elif isinstance(value, date):
+        worksheet.write_datetime(row_number, column, value, formats.get_date_format())
+    else:
+        worksheet.write(row_number, column, value)
+
+
+class ColumnTypes:
+    """Tracks the types of values seen in a column to tell whether pandas would
+    read the column as float64 ie. all values are numbers or missing with at
+    least one float or a mix of integers and missing values.
+    """
+
+    __slots__ = ("has_float", "has_int", "has_null", "has_other")
+
+    def __init__(self):
+        self.has_float = False
+        self.has_int = False
+        self.has_null = False
+        self.has_other = False
+
+    def add(self, value):
+        value_type = type(value)
+        if value_type is float:
+            self.has_float = True
+        elif value_type is int:
+            self.has_int = True
+        elif value is None:
+            self.has_null = True
+        else:
+            self.has_other = True
+
+    def is_float(self):
+        if self.has_other:
+            return False
+        return self.has_float or (self.has_int and self.has_null)
+
+
+class StreamingWriter:
+    """Writes rows of one resource of a country or world dataset to CSV and XLSX
+    as they arrive. The CSV matches what write_list_to_csv produces and is
+    written directly. As whether a column is float64, and so gets the float
+    format, may only be known once its last value arrives, eg. integers
+    followed by a missing value, rows are spooled in batches to a temporary
+    file and the XLSX is written from it on close by xlsxwriter in constant
+    memory mode with the same header, float and date formats that
+    generate_resource applies through pandas.
+
+    Args:
+        folder (str): Folder in which to write files
+        filename (str): Filename without extension
+        headers (List[str]): Column headers
+    """
+
+    batch_size = 4096
+
+    def __init__(self, folder, filename, headers):
+        self.filename = filename
+        self.headers = list(headers)
+        self.paths = {
+            "csv": join(folder, f"{filename}.csv"),
+            "xlsx": join(folder, f"{filename}.xlsx"),
+        }
+        self.row_count = 0
+        self.column_types = [ColumnTypes() for _ in self.headers]
+        self.csv_file = open(self.paths["csv"], "w", encoding="utf-8", newline="")
+        self.csv_writer = csv.writer(self.csv_file)
+        self.csv_writer.writerow(get_csv_headers(self.headers))
+        self.spool = TemporaryFile()
+        self.batch = []
+
+    def __len__(self):
+        return self.row_count
+
+    def append(self, row):
+        """Write a row in list form
+
+        Args:
+            row (Sequence): Row to write in header order
+
+        Returns:
+            None
+        """
+        # write_list_to_csv drops rows with no values
+        if any(value is not None and value != "" for value in row):
+            self.csv_writer.writerow([csv_cell(value) for value in row])
+        self.row_count += 1
+        for column_types, value in zip(self.column_types, row):
+            column_types.add(value)
+        self.batch.append(list(row))
+        if len(self.batch) >= self.batch_size:
+            self.flush_batch()
+
+    def flush_batch(self):
+        pickle.dump(self.batch, self.spool, protocol=pickle.HIGHEST_PROTOCOL)
+        self.batch = []
+
+    def read_spool(self):
+        self.spool.seek(0)
+        while True:
+            try:
+                batch = pickle.load(self.spool)
+            except EOFError:
+                return
+            yield from batch
+
+    def close(self):
+        """Close the CSV file and write the XLSX from the spooled rows,
+        applying float formats to the columns that turned out to be float
+
+        Returns:
+            None
+        """
+        self.csv_file.close()
+        if self.batch:
+            self.flush_batch()
+        workbook = Workbook(self.paths["xlsx"], {"constant_memory": True})
+        worksheet = workbook.add_worksheet(self.filename[:24])
+        formats = CellFormats(workbook)
+        # In constant memory mode a column format only applies to cells
+        # written after it is set
+        for column, column_types in enumerate(self.column_types):
+            if column_types.is_float():
+                worksheet.set_column(column, column, None, formats.get_float_format())
+        header_format = workbook.add_format(_HEADER_FORMAT)
+        for column, header in enumerate(self.headers):
+            worksheet.write_string(0, column, header, header_format)
+        with self.spool:
+            for row_number, row in enumerate(self.read_spool(), 1):
+                for column, value in enumerate(row):
+                    write_cell(worksheet, formats, row_number, column, value)
+        workbook.close()
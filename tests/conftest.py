@@ -1,12 +1,27 @@
-from os.path import join
+import json
+import os
+import re
+from copy import deepcopy
+from email import message_from_bytes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from os.path import abspath, join
+from threading import Lock, Thread
 
 import pytest
 from hdx.api.configuration import Configuration
 from hdx.api.locations import Locations
 from hdx.data.vocabulary import Vocabulary
 from hdx.location.country import Country
+from hdx.utilities.downloader import Download
+from hdx.utilities.errors_onexit import ErrorsOnExit
+from hdx.utilities.path import temp_dir
+from hdx.utilities.retriever import Retrieve
 from hdx.utilities.useragent import UserAgent
 
+from hdx.scraper.unhabitat.__main__ import main
+from hdx.scraper.unhabitat.unhabitat import UNHabitat
+
 
 @pytest.fixture(scope="session")
 def fixtures_dir():
@@ -50,3 +65,230 @@ def configuration(config_dir):
         "name": "approved",
     }
     return Configuration.read()
+
+
+@pytest.fixture
+def tempdir(request):
+    name = f"{request.cls.__name__}_{request.node.name}"
+    with temp_dir(name, delete_on_success=True, delete_on_failure=False) as folder:
+        yield folder
+
+
+@pytest.fixture
+def retriever(tempdir, input_dir):
+    with Download(user_agent="test") as downloader:
+        yield Retrieve(
+            downloader=downloader,
+            fallback_dir=tempdir,
+            saved_dir=input_dir,
+            temp_dir=tempdir,
+            save=False,
+            use_saved=True,
+        )
+
+
+@pytest.fixture
+def make_unhabitat(configuration, retriever, tempdir):
+    """Function creating UNHabitat objects for a copy of the configuration, or
+    of config if given, with its countries set. They use the retriever, which
+    reads the saved input files, and write to tempdir. Other keyword arguments
+    are passed to UNHabitat."""
+
+    def make_unhabitat(config=None, countries=("AFG",), errors=None, **kwargs):
+        config = deepcopy(dict(config or configuration))
+        config["countries"] = list(countries)
+        if errors is None:
+            errors = ErrorsOnExit()
+        return UNHabitat(config, retriever, tempdir, errors, **kwargs)
+
+    return make_unhabitat
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Stand-in for ArcGIS item data endpoints and the CKAN action API"""
+
+    input_dir = None
+    locations = [
+        {"name": "afg", "title": "Afghanistan"},
+        {"name": "world", "title": "World"},
+    ]
+    vocabulary = {
+        "tags": [{"name": "sustainable development goals-sdg"}, {"name": "urban"}],
+        "id": "b891512e-9516-4bf5-962a-7a289772a2a1",
+        "name": "approved",
+    }
+    packages = {}
+    actions = []
+    downloads = []
+    # Names of packages whose creation fails
+    failing = set()
+    lock = Lock()
+
+    def do_GET(self):
+        with self.lock:
+            self.downloads.append(self.path)
+        match = re.match(r"/sharing/rest/content/items/(\w+)/data$", self.path)
+        if not match:
+            self.send_error(404)
+            return
+        with open(join(self.input_dir, f"{match.group(1)}-data.xlsx"), "rb") as file:
+            content = file.read()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_POST(self):
+        action = self.path.rsplit("/", 1)[-1]
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        content_type = self.headers["Content-Type"]
+        if content_type.startswith("multipart/form-data"):
+            message = message_from_bytes(
+                f"Content-Type: {content_type}\r\n\r\n".encode() + body
+            )
+            data = {
+                part.get_param("name", header="content-disposition"): part.get_payload(
+                    decode=True
+                )
+                for part in message.get_payload()
+            }
+        else:
+            data = json.loads(body or b"{}")
+        with self.lock:
+            self.actions.append(action)
+            if action == "package_show":
+                package = self.get_package(data["id"])
+                if not package:
+                    self.respond(404, {"__type": "Not Found Error"})
+                    return
+                self.respond(200, package)
+            elif action == "package_create":
+                if data["name"] in self.failing:
+                    self.respond(409, {"__type": "Validation Error"})
+                    return
+                self.respond(200, self.save_package(data))
+            elif action == "package_revise":
+                package = self.get_package(json.loads(data["match"])["id"])
+                package.update(json.loads(data["update"]))
+                self.respond(200, {"package": self.save_package(package)})
+            elif action == "user_show":
+                self.respond(200, {"id": "test", "name": "test"})
+            elif action == "organization_list_for_user":
+                self.respond(200, [{"id": "unhabitat-das", "name": "unhabitat-das"}])
+            elif action == "group_list":
+                self.respond(200, self.locations)
+            elif action == "vocabulary_show":
+                self.respond(200, self.vocabulary)
+            else:
+                self.respond(200, {})
+
+    def get_package(self, id_or_name):
+        for package in self.packages.values():
+            if id_or_name in (package["id"], package["name"]):
+                return package
+        return None
+
+    def save_package(self, package):
+        package["id"] = f"id-{package['name']}"
+        for index, resource in enumerate(package.get("resources", [])):
+            resource["id"] = f"{package['id']}-{index}"
+        self.packages[package["name"]] = package
+        return package
+
+    def respond(self, status, result):
+        if status == 200:
+            content = {"success": True, "result": result}
+        else:
+            content = {"success": False, "error": result}
+        content = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="session")
+def server_url(input_dir):
+    Handler.input_dir = input_dir
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def hdx_configuration(configuration, server_url):
+    original = Configuration._configuration
+    Configuration._create(
+        hdx_url=server_url,
+        hdx_key="test",
+        hdx_read_only=False,
+        user_agent="test",
+    )
+    yield Configuration.read()
+    Configuration._configuration = original
+
+
+@pytest.fixture
+def hdx_server(server_url):
+    Handler.packages = {}
+    Handler.actions = []
+    Handler.downloads = []
+    Handler.failing = set()
+    return Handler
+
+
+def run_main(server_url, config_dir, folder, **kwargs):
+    """Run main for open_spaces in AFG against the stand-in HDX server from
+    folder as working directory. This is the target of the separate processes
+    of run_main_processes, so it sets up the configuration the test fixtures
+    give the test process.
+    """
+    project_config_yaml = abspath(join(config_dir, "project_configuration.yaml"))
+    os.chdir(folder)
+    UserAgent.set_global("test")
+    Configuration._create(
+        hdx_url=server_url,
+        hdx_key="test",
+        hdx_read_only=False,
+        user_agent="test",
+        project_config_yaml=project_config_yaml,
+    )
+    configuration = Configuration.read()
+    configuration["countries"] = ["AFG"]
+    resource_infos = configuration["datasets"]["open_spaces"]["resources"]
+    for resource_info in resource_infos.values():
+        resource_info["base_url"] = resource_info["base_url"].replace(
+            "https://guo-un-habitat.maps.arcgis.com", server_url
+        )
+    Locations.set_validlocations(Handler.locations)
+    Vocabulary._approved_vocabulary = Handler.vocabulary
+    main(datasets="open_spaces", **kwargs)
+
+
+@pytest.fixture
+def run_main_processes(hdx_server, server_url, config_dir):
+    """Function running main with each of a list of keyword arguments in
+    separate processes at once from a folder, returning their exit codes"""
+
+    def run_main_processes(kwargs_list, folder):
+        context = get_context("spawn")
+        processes = [
+            context.Process(
+                target=run_main, args=(server_url, config_dir, folder), kwargs=kwargs
+            )
+            for kwargs in kwargs_list
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return [process.exitcode for process in processes]
+
+    return run_main_processes
@@ -0,0 +1,62 @@
+from os.path import join
+
+import pytest
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.unhabitat.benchmark import compare, main, run_benchmarks
+
+
+class TestBenchmark:
+    def test_benchmark(self, configuration):
+        results = run_benchmarks([100], "open_spaces", "resource_1")
+        run = results["runs"]["100"]
+        assert run["countries"] == 205
+        assert list(run["stages"]) == [
+            "ingest",
+            "iso3",
+            "routing",
+            "csv",
+            "csv_list",
+            "xlsx",
+            "xlsx_pandas",
+        ]
+        for measures in run["stages"].values():
+            assert measures["seconds"] >= 0
+            assert measures["peak_memory_mb"] >= 0
+        assert compare(results, results) == []
+
+        baseline = {
+            "runs": {
+                "100": {
+                    "stages": {
+                        "ingest": {"seconds": 0.1, "peak_memory_mb": 1.0},
+                        "csv": {"seconds": 0.01, "peak_memory_mb": 1.0},
+                    }
+                }
+            }
+        }
+        results = {
+            "runs": {
+                "100": {
+                    "stages": {
+                        "ingest": {"seconds": 0.2, "peak_memory_mb": 1.1},
+                        "csv": {"seconds": 1.0, "peak_memory_mb": 2.0},
+                    }
+                }
+            }
+        }
+        assert compare(results, baseline) == [
+            "100 rows ingest seconds: 0.2 > 0.1",
+            "100 rows csv peak_memory_mb: 2.0 > 1.0",
+        ]
+
+    def test_missing_baseline(self):
+        with temp_dir(
+            "TestBenchmarkBaseline",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as tempdir:
+            baseline = join(tempdir, "missing.json")
+            with pytest.raises(SystemExit) as excinfo:
+                main(["--rows", "10", "--baseline", baseline])
+            assert excinfo.value.code == 2
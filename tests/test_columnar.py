@@ -0,0 +1,132 @@
+from copy import deepcopy
+from os import listdir, mkdir
+from os.path import join
+from zipfile import ZipFile
+
+import pytest
+from hdx.utilities.errors_onexit import ErrorsOnExit
+
+from hdx.scraper.unhabitat.columnar import ColumnarRouter
+from hdx.scraper.unhabitat.router import ResourceRouter
+from hdx.scraper.unhabitat.table import RowSubset
+from hdx.scraper.unhabitat.unhabitat import UNHabitat
+
+
+def read_xlsx_parts(path):
+    # The creation time in the document properties differs between runs
+    with ZipFile(path) as file:
+        return {
+            name: file.read(name)
+            for name in file.namelist()
+            if name != "docProps/core.xml"
+        }
+
+
+class TestColumnarRouter:
+    headers = ["Country", "Year", "End Year", "Value"]
+    rows = [
+        ["Afghanistan", 2020, 2021, 1],
+        ["", 2020, None, 2],
+        ["Sudan", 2015.0, 2015, 3],
+        ["Afghanistan", None, 2020.0, 4],
+        [None, 2010, 2011, 5],
+        ["France", 2010, None, 6],
+        ["Sudan", 2016, "", 7],
+    ]
+    iso3s = {"Afghanistan": "AFG", "Sudan": "SDN", "France": "FRA"}
+
+    @pytest.mark.parametrize(
+        "resource_info",
+        [
+            {"country_header": "Country", "date_header": ["Year", "End Year"]},
+            {"country_header": "Country", "date_min": 2000, "date_max": 2005},
+            {"country_header": "Country"},
+        ],
+    )
+    @pytest.mark.parametrize(
+        "countries", [["SDN", "AFG"], {"AFG": "test_AFG", "SDN": "test_SDN"}, []]
+    )
+    def test_route(self, resource_info, countries):
+        routers = [
+            router_class("test", "resource_1", resource_info, countries, self.headers)
+            for router_class in (ResourceRouter, ColumnarRouter)
+        ]
+        for router in routers:
+            router.route(iter(self.rows), self.iso3s.get)
+        expected, router = routers
+        assert list(router.rows) == list(expected.rows)
+        assert router.rows == expected.rows
+        for name, rows in router.rows.items():
+            assert type(rows) is type(expected.rows[name])
+            if isinstance(rows, RowSubset):
+                assert rows.table is router.rows["test_world"]
+        assert router.dates == expected.dates
+        # The first of equal years is kept
+        for name, dates in router.dates.items():
+            assert sorted(map(repr, dates)) == sorted(map(repr, expected.dates[name]))
+
+    def test_route_create_rows(self):
+        resource_info = {"country_header": "Country", "date_header": ["Year"]}
+        routers = [
+            router_class(
+                "test",
+                "resource_1",
+                resource_info,
+                ["AFG", "SDN"],
+                self.headers,
+                lambda iso3: [],
+            )
+            for router_class in (ResourceRouter, ColumnarRouter)
+        ]
+        for router in routers:
+            router.route(iter(self.rows), self.iso3s.get)
+        expected, router = routers
+        for rows in (router.rows, expected.rows):
+            for name, name_rows in rows.items():
+                rows[name] = list(map(tuple, name_rows))
+        assert router.rows == expected.rows
+        assert router.dates == expected.dates
+
+    def test_route_no_countries(self):
+        resource_info = {"country_header": "Country", "date_header": ["Year"]}
+        router = ColumnarRouter(
+            "test", "resource_1", resource_info, ["AFG"], self.headers
+        )
+        router.route(iter([["", 2020, 2020, 1], [None, 2021, 2021, 2]]), None)
+        assert router.rows == {}
+        assert router.dates == {}
+        router.route(iter([]), None)
+        assert router.rows == {}
+        assert router.dates == {}
+
+
+class TestColumnarEngine:
+    @pytest.mark.parametrize("streaming", [False, True])
+    def test_files_byte_compatible(self, configuration, retriever, tempdir, streaming):
+        dates = {}
+        for engine in ("rows", "columnar"):
+            folder = join(tempdir, engine)
+            mkdir(folder)
+            unhabitat = UNHabitat(
+                deepcopy(dict(configuration)),
+                retriever,
+                folder,
+                ErrorsOnExit(),
+                streaming=streaming,
+                engine=engine,
+            )
+            dataset_names = unhabitat.get_data(datasets=["open_spaces"])
+            assert len(dataset_names) > 2
+            assert unhabitat.write_files(dataset_names, 2) == dataset_names
+            dates[engine] = unhabitat.dates
+
+        assert dates["columnar"] == dates["rows"]
+        filenames = sorted(listdir(join(tempdir, "rows")))
+        assert sorted(listdir(join(tempdir, "columnar"))) == filenames
+        for filename in filenames:
+            paths = [join(tempdir, engine, filename) for engine in ("rows", "columnar")]
+            if filename.endswith(".xlsx"):
+                expected, actual = map(read_xlsx_parts, paths)
+            else:
+                expected, actual = (open(path, "rb").read() for path in paths)
+            assert actual == expected, filename
@@ -0,0 +1,31 @@
+from os.path import exists, join
+
+from hdx.location.country import Country
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.unhabitat.country_data import get_country, set_snapshot_path
+
+
+class TestCountryData:
+    def test_snapshot(self, configuration):
+        countriesdata = Country._countriesdata
+        with temp_dir(
+            "TestCountryData",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as tempdir:
+            path = join(tempdir, "countries.pickle")
+            set_snapshot_path(path)
+            try:
+                Country._countriesdata = None
+                assert get_country().get_iso3_country_code("Afghanistan") == "AFG"
+                assert exists(path)
+                assert not exists(f"{path}.part")
+
+                Country._countriesdata = None
+                country = get_country()
+                assert country._countriesdata == countriesdata
+                assert country.get_country_name_from_iso3("AFG") == "Afghanistan"
+            finally:
+                set_snapshot_path(None)
+                Country._countriesdata = countriesdata
@@ -0,0 +1,31 @@
+import pytest
+
+from hdx.scraper.unhabitat.country_index import CountryIndex
+
+
+class TestCountryIndex:
+    def test_country_index(self, configuration):
+        country_index = CountryIndex(configuration)
+        assert "AFG" in country_index.iso3s
+        assert len(country_index.iso3s) == len(configuration["countries"])
+        assert country_index.bucket_keys["open_spaces"]["AFG"] == "open_spaces_AFG"
+        assert "world" not in country_index.bucket_keys["open_spaces"]
+
+        target = country_index.get_target("open_spaces_AFG")
+        assert target.config_name == "open_spaces"
+        assert target.iso3 == "AFG"
+        assert target.country_name == "Afghanistan"
+        assert target.filenames["resource_1"] == "SDG_11-7-1_AFG"
+        target = country_index.get_target("open_spaces_world")
+        assert target.country_name == "world"
+        assert target.filenames["resource_1"] == "SDG_11-7-1"
+        target = country_index.get_target("basic_services")
+        assert target.config_name == "basic_services"
+        assert target.iso3 == "world"
+        with pytest.raises(ValueError):
+            country_index.get_target("open_spaces_XXX")
+
+        assert country_index.get_dataset_names("open_spaces", {"AFG", "world"}) == [
+            "open_spaces_AFG",
+            "open_spaces_world",
+        ]
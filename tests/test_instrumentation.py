@@ -0,0 +1,90 @@
+from copy import deepcopy
+from os.path import getsize, join
+
+import pytest
+from hdx.utilities.loader import load_json
+
+from hdx.scraper.unhabitat.__main__ import main
+from hdx.scraper.unhabitat.instrumentation import Instrumentation
+from hdx.scraper.unhabitat.source_cache import SourceCache
+
+
+class TestInstrumentation:
+    def test_disabled(self):
+        instrumentation = Instrumentation()
+        with instrumentation.span("download") as span:
+            span.add_rows(10)
+        instrumentation.record("iso3", 1.0)
+        assert instrumentation.records == []
+        assert instrumentation.get_summary() == {}
+
+    def test_unknown_trace_format(self):
+        # Rejected before any dataset is generated or uploaded
+        with pytest.raises(ValueError, match="Unknown trace format xml"):
+            main(trace_path="trace.xml", trace_format="xml")
+
+    def test_instrumentation(self, make_unhabitat, tempdir):
+        instrumentation = Instrumentation(True)
+        unhabitat = make_unhabitat(instrumentation=instrumentation)
+        unhabitat.get_data(datasets=["open_spaces"])
+        unhabitat.generate_dataset("open_spaces_AFG")
+        summary = instrumentation.get_summary()
+        assert list(summary) == [
+            "download",
+            "route",
+            "iso3",
+            "write_csv",
+            "write_xlsx",
+        ]
+        assert summary["download"]["count"] == 2
+        # Saved files are not downloaded
+        assert summary["download"]["bytes"] == 0
+        assert summary["route"]["count"] == 2
+        assert summary["write_csv"]["count"] == 2
+        assert summary["write_csv"]["rows"] == summary["write_xlsx"]["rows"]
+        record = instrumentation.records[-1]
+        assert record["stage"] == "write_xlsx"
+        assert record["dataset"] == "open-spaces-afg"
+        assert record["peak_rss_mb"] > 0
+        instrumentation.log_summary()
+
+        path = join(tempdir, "trace.json")
+        instrumentation.save(path)
+        trace = load_json(path)
+        assert trace["records"] == instrumentation.records
+        instrumentation.save(path, "chrome")
+        trace = load_json(path)
+        assert len(trace["traceEvents"]) == len(instrumentation.records)
+        event = trace["traceEvents"][-1]
+        assert event["ph"] == "X"
+        assert event["name"] == "write_xlsx open-spaces-afg"
+
+    def test_download_bytes(
+        self, configuration, make_unhabitat, retriever, hdx_server, server_url, tempdir
+    ):
+        retriever.use_saved = False
+        config = deepcopy(dict(configuration))
+        resource_infos = config["datasets"]["open_spaces"]["resources"]
+        for resource_info in resource_infos.values():
+            resource_info["base_url"] = resource_info["base_url"].replace(
+                "https://guo-un-habitat.maps.arcgis.com", server_url
+            )
+        source_cache = SourceCache(join(tempdir, "sources"), ttl=3600)
+
+        def get_download_bytes(**kwargs):
+            instrumentation = Instrumentation(True)
+            unhabitat = make_unhabitat(
+                config, instrumentation=instrumentation, **kwargs
+            )
+            file_paths = unhabitat.prefetch(["open_spaces"])
+            summary = instrumentation.get_summary()
+            assert summary["download"]["count"] == 2
+            return summary["download"]["bytes"], file_paths
+
+        nbytes, file_paths = get_download_bytes()
+        size = sum(getsize(path) for path in file_paths.values())
+        assert nbytes == size > 0
+        assert get_download_bytes(source_cache=source_cache)[0] == size
+        # Files used from the source cache are not downloaded again
+        assert get_download_bytes(source_cache=source_cache)[0] == 0
+        assert len(hdx_server.downloads) == 4
@@ -0,0 +1,32 @@
+from os.path import join
+
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.unhabitat.iso3_cache import ISO3Cache
+
+
+class TestISO3Cache:
+    def test_iso3_cache(self, configuration):
+        with temp_dir(
+            "TestISO3Cache",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as tempdir:
+            path = join(tempdir, "iso3_cache.json")
+            iso3_cache = ISO3Cache(path)
+            assert iso3_cache.get_iso3("Afghanistan") == "AFG"
+            assert iso3_cache.get_iso3("Afghanistan") == "AFG"
+            assert iso3_cache.get_iso3("Sub-Saharan Africa") is None
+            assert iso3_cache.get_iso3("Sub-Saharan Africa") is None
+            assert iso3_cache.hits == 2
+            assert iso3_cache.misses == 2
+            iso3_cache.save()
+
+            iso3_cache = ISO3Cache(path)
+            assert iso3_cache.iso3s == {
+                "Afghanistan": "AFG",
+                "Sub-Saharan Africa": None,
+            }
+            assert iso3_cache.get_iso3("Afghanistan") == "AFG"
+            assert iso3_cache.hits == 1
+            assert iso3_cache.misses == 0
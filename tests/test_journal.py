@@ -0,0 +1,125 @@
+import os
+import pickle
+from os import listdir
+from os.path import join
+
+import pytest
+from hdx.location.country import Country
+from hdx.utilities.errors_onexit import ErrorsOnExit
+
+from hdx.scraper.unhabitat.__main__ import prepare_dataset
+from hdx.scraper.unhabitat.journal import Journal
+from hdx.scraper.unhabitat.unhabitat import UNHabitat
+
+
+class TestJournal:
+    def test_journal(self, make_unhabitat, tempdir):
+        journal = Journal(tempdir)
+        unhabitat = make_unhabitat(countries=("AFG", "ATA"), journal=journal)
+        file_paths = unhabitat.prefetch(["open_spaces"])
+        assert len(file_paths) == 2
+        generated = {}
+        for dataset_name in unhabitat.get_dataset_names(["open_spaces"]):
+            generated[dataset_name] = unhabitat.generate_dataset(dataset_name)
+        assert generated["open_spaces_ATA"] is None
+        # As in pipeline runs, datasets are prepared before uploading
+        for dataset in generated.values():
+            if dataset:
+                prepare_dataset(dataset)
+        # Upload of world dataset fails
+        journal.record_uploaded("open_spaces_AFG", generated["open_spaces_AFG"])
+        assert journal.entries["parsed"] == {
+            "open_spaces": {
+                "datasets": ["open_spaces_AFG", "open_spaces_world"],
+                "time": journal.entries["parsed"]["open_spaces"]["time"],
+            }
+        }
+        assert not any(file.endswith(".part") for file in listdir(tempdir))
+
+        path = join(tempdir, "journal.jsonl")
+        with open(path) as file:
+            lines = file.readlines()
+        # Batch and one line per entry: 1 fetched, 1 parsed, 3 generated
+        # and 1 uploaded
+        assert len(lines) == 7
+        # Entry cut short by interrupted run
+        with open(path, "a") as file:
+            file.write('{"stage": "uploaded", "name": "open_sp')
+        journal = Journal(tempdir, resume=True)
+        with open(path) as file:
+            assert file.readlines() == lines
+        assert journal.batch == unhabitat.journal.batch
+        assert journal.is_complete("open_spaces_AFG")
+        assert journal.is_complete("open_spaces_ATA")
+        assert not journal.is_complete("open_spaces_world")
+        assert journal.is_generated("open_spaces_world")
+        # Nothing is downloaded or parsed again so no retriever is needed
+        errors = ErrorsOnExit()
+        unhabitat = UNHabitat(
+            unhabitat.configuration, None, tempdir, errors, journal=journal
+        )
+        assert unhabitat.prefetch(["open_spaces"]) == file_paths
+        assert unhabitat.fetched == {"open_spaces"}
+        assert errors.shared_errors["error"] == {}
+        dataset = unhabitat.generate_dataset("open_spaces_world")
+        assert unhabitat.loaded == set()
+        prepare_dataset(dataset)
+        expected = generated["open_spaces_world"]
+        assert "\n" in expected["notes"]
+        assert dataset["notes"] == expected["notes"]
+        assert dataset.data == expected.data
+        assert [
+            (resource.data, resource.get_file_to_upload())
+            for resource in dataset.get_resources()
+        ] == [
+            (resource.data, resource.get_file_to_upload())
+            for resource in expected.get_resources()
+        ]
+
+        with pytest.raises(ValueError):
+            Journal(tempdir, resume=True, batch="other")
+        journal = Journal(tempdir)
+        assert journal.batch != unhabitat.journal.batch
+        assert not journal.is_complete("open_spaces_AFG")
+
+    @pytest.mark.parametrize("pipeline", [False, True])
+    def test_resume(
+        self, configuration, hdx_server, run_main_processes, tempdir, pipeline
+    ):
+        country_snapshot_path = join(tempdir, "countries.pkl")
+        with open(country_snapshot_path, "wb") as file:
+            pickle.dump(Country.countriesdata(False), file)
+        journal_dir = join(tempdir, "run")
+        # Run with the default flags, so sources are saved
+        kwargs = {
+            "journal_dir": journal_dir,
+            "country_snapshot_path": country_snapshot_path,
+            "pipeline": pipeline,
+        }
+        hdx_server.failing = {"open-spaces-world"}
+        assert run_main_processes([kwargs], tempdir) == [0]
+        assert list(hdx_server.packages) == ["open-spaces-afg"]
+        assert len(hdx_server.downloads) == 2
+
+        # The world dataset is uploaded from its journaled files without
+        # downloading its sources
+        kwargs["resume"] = True
+        assert run_main_processes([kwargs], tempdir) == [0]
+        assert list(hdx_server.packages) == ["open-spaces-afg"]
+        assert len(hdx_server.downloads) == 2
+
+        # Even if the sources were lost, they are not needed to upload it
+        journal = Journal(journal_dir, resume=True)
+        for path in journal.entries["fetched"]["open_spaces"]["files"].values():
+            os.remove(path)
+        assert run_main_processes([kwargs], tempdir) == [0]
+        assert list(hdx_server.packages) == ["open-spaces-afg"]
+        assert len(hdx_server.downloads) == 2
+
+        # The files of the world dataset were lost too so it is generated again
+        for resource in journal.entries["generated"]["open_spaces_world"]["resources"]:
+            os.remove(resource["file"])
+        hdx_server.failing = set()
+        assert run_main_processes([kwargs], tempdir) == [0]
+        assert sorted(hdx_server.packages) == ["open-spaces-afg", "open-spaces-world"]
+        assert len(hdx_server.downloads) == 4
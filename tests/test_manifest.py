@@ -0,0 +1,94 @@
+from os.path import join
+
+from hdx.scraper.unhabitat.manifest import Manifest
+
+
+class TestManifest:
+    @staticmethod
+    def upload(manifest, dataset_name, dataset):
+        for resource in dataset.get_resources():
+            if resource.get_file_to_upload():
+                resource["url"] = f"https://test/{resource['name']}"
+        manifest.record_upload(dataset_name, dataset)
+
+    def test_manifest(self, make_unhabitat, tempdir):
+        path = join(tempdir, "manifest.json")
+
+        manifest = Manifest(path)
+        unhabitat = make_unhabitat(manifest=manifest)
+        dataset_names = unhabitat.get_data(datasets=["open_spaces"])
+        assert dataset_names == ["open_spaces_AFG", "open_spaces_world"]
+        for dataset_name in dataset_names:
+            dataset = unhabitat.generate_dataset(dataset_name)
+            assert manifest.outputs_unchanged(dataset_name, dataset) is False
+            # Only upload one dataset so inputs are not committed
+            if dataset_name == "open_spaces_AFG":
+                self.upload(manifest, dataset_name, dataset)
+        manifest.save()
+        assert manifest.inputs == {}
+        assert list(manifest.outputs) == ["open_spaces_AFG"]
+
+        manifest = Manifest(path)
+        unhabitat = make_unhabitat(manifest=manifest)
+        dataset_names = unhabitat.get_data(datasets=["open_spaces"])
+        assert dataset_names == ["open_spaces_AFG", "open_spaces_world"]
+        dataset = unhabitat.generate_dataset("open_spaces_AFG")
+        assert manifest.outputs_unchanged("open_spaces_AFG", dataset) is True
+        dataset = unhabitat.generate_dataset("open_spaces_world")
+        assert manifest.outputs_unchanged("open_spaces_world", dataset) is False
+        self.upload(manifest, "open_spaces_world", dataset)
+        manifest.save()
+        assert manifest.skipped_datasets == ["open_spaces_AFG"]
+        assert manifest.datasets == {
+            "open_spaces": ["open_spaces_AFG", "open_spaces_world"]
+        }
+
+        manifest = Manifest(path)
+        unhabitat = make_unhabitat(manifest=manifest)
+        assert unhabitat.get_data(datasets=["open_spaces"]) == []
+        assert manifest.skipped_inputs == ["open_spaces"]
+
+        # A changed file is uploaded while the unchanged files of the
+        # dataset keep their existing urls
+        unhabitat = make_unhabitat()
+        unhabitat.get_data(datasets=["open_spaces"])
+        dataset = unhabitat.generate_dataset("open_spaces_AFG")
+        with open(join(tempdir, "SDG_11-7-1_AFG.csv"), "a") as file:
+            file.write("\n")
+        assert manifest.outputs_unchanged("open_spaces_AFG", dataset) is False
+        resources = {resource["name"]: resource for resource in dataset.get_resources()}
+        resource = resources["SDG_11-7-1_AFG (csv)"]
+        assert resource.get_file_to_upload() == join(tempdir, "SDG_11-7-1_AFG.csv")
+        resource = resources["SDG_11-7-1_AFG (xlsx)"]
+        assert resource.get_file_to_upload() is None
+        assert resource["url"] == "https://test/SDG_11-7-1_AFG (xlsx)"
+        assert len(manifest.skipped_resources) == 3
+
+        # A run responsible for only some datasets, eg. a shard or one
+        # with countries filtered, commits inputs once those are
+        # uploaded, which a rerun of the same datasets skips
+        path = join(tempdir, "selected_manifest.json")
+        manifest = Manifest(path)
+        unhabitat = make_unhabitat(manifest=manifest)
+        unhabitat.select(["open_spaces_AFG"])
+        unhabitat.get_data(datasets=["open_spaces"])
+        dataset = unhabitat.generate_dataset("open_spaces_AFG")
+        assert manifest.outputs_unchanged("open_spaces_AFG", dataset) is False
+        self.upload(manifest, "open_spaces_AFG", dataset)
+        manifest.save()
+        assert manifest.datasets == {"open_spaces": ["open_spaces_AFG"]}
+
+        manifest = Manifest(path)
+        unhabitat = make_unhabitat(manifest=manifest)
+        unhabitat.select(["open_spaces_AFG"])
+        assert unhabitat.get_data(datasets=["open_spaces"]) == []
+        assert manifest.skipped_inputs == ["open_spaces"]
+
+        # A run generating all the datasets does not skip the inputs
+        manifest = Manifest(path)
+        unhabitat = make_unhabitat(manifest=manifest)
+        assert unhabitat.get_data(datasets=["open_spaces"]) == [
+            "open_spaces_AFG",
+            "open_spaces_world",
+        ]
+        assert manifest.skipped_inputs == []
@@ -0,0 +1,68 @@
+import asyncio
+import uuid
+from copy import deepcopy
+
+from hdx.utilities.errors_onexit import ErrorsOnExit
+
+from hdx.scraper.unhabitat.__main__ import prepare_dataset, upload_dataset
+from hdx.scraper.unhabitat.pipeline import Pipeline
+from hdx.scraper.unhabitat.publisher import Publisher
+
+
+class TestPipeline:
+    def test_pipeline(
+        self,
+        configuration,
+        hdx_configuration,
+        hdx_server,
+        server_url,
+        make_unhabitat,
+        retriever,
+    ):
+        config = deepcopy(dict(configuration))
+        for resource_info in config["datasets"]["open_spaces"]["resources"].values():
+            resource_info["base_url"] = resource_info["base_url"].replace(
+                "https://guo-un-habitat.maps.arcgis.com", server_url
+            )
+        # Source files are downloaded from the stand-in server
+        retriever.use_saved = False
+        errors = ErrorsOnExit()
+        unhabitat = make_unhabitat(config, errors=errors)
+        config_names = ["open_spaces"]
+        dataset_names = unhabitat.get_dataset_names(config_names)
+        batch = str(uuid.uuid4())
+        publisher = Publisher(
+            unhabitat,
+            prepare_dataset,
+            lambda dataset: upload_dataset(dataset, batch),
+            errors,
+        )
+        pipeline = Pipeline(publisher, upload_workers=2, queue_size=1)
+        uploaded = asyncio.run(pipeline.run(config_names, dataset_names))
+        assert sorted(dataset["name"] for dataset in uploaded) == [
+            "open-spaces-afg",
+            "open-spaces-world",
+        ]
+        assert sorted(hdx_server.packages) == [
+            "open-spaces-afg",
+            "open-spaces-world",
+        ]
+        package = hdx_server.packages["open-spaces-afg"]
+        assert package["batch"] == batch
+        assert len(package["resources"]) == 4
+        assert hdx_server.actions.count("package_revise") == 2
+        assert errors.shared_errors["error"] == {}
+        assert unhabitat.data == {}
+
+    def test_upload_failure(self, hdx_configuration, make_unhabitat):
+        errors = ErrorsOnExit()
+        unhabitat = make_unhabitat(errors=errors)
+
+        def upload(dataset):
+            raise ValueError("no upload")
+
+        publisher = Publisher(unhabitat, prepare_dataset, upload, errors)
+        pipeline = Pipeline(publisher)
+        uploaded = asyncio.run(pipeline.run(["open_spaces"], ["open_spaces_AFG"]))
+        assert uploaded == []
+        assert list(errors.shared_errors["error"]) == ["open-spaces-afg"]
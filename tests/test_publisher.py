@@ -0,0 +1,33 @@
+from os.path import join
+
+import pytest
+from hdx.utilities.errors_onexit import ErrorsOnExit
+
+from hdx.scraper.unhabitat.__main__ import prepare_dataset
+from hdx.scraper.unhabitat.manifest import Manifest
+from hdx.scraper.unhabitat.publisher import Publisher
+
+
+class TestPublisher:
+    @pytest.mark.parametrize("generate_workers", [None, 1, 2])
+    def test_publisher(self, make_unhabitat, tempdir, generate_workers):
+        errors = ErrorsOnExit()
+        manifest = Manifest(join(tempdir, "manifest.json"))
+        unhabitat = make_unhabitat(errors=errors, manifest=manifest)
+
+        def upload(dataset):
+            if dataset["name"] == "open-spaces-world":
+                raise ValueError("no upload")
+            for resource in dataset.get_resources():
+                resource["url"] = f"https://test/{resource['name']}"
+
+        publisher = Publisher(unhabitat, prepare_dataset, upload, errors, manifest)
+        dataset_names = ["open_spaces_AFG", "open_spaces_world"]
+        if generate_workers is None:
+            uploaded = publisher.publish(dataset_names)
+        else:
+            uploaded = publisher.publish_parallel(dataset_names, generate_workers, 2)
+        assert [dataset["name"] for dataset in uploaded] == ["open-spaces-afg"]
+        assert list(errors.shared_errors["error"]) == ["open-spaces-world"]
+        assert manifest.new_outputs["open_spaces_AFG"]["uploaded"] is True
+        assert "uploaded" not in manifest.new_outputs["open_spaces_world"]
@@ -0,0 +1,57 @@
+from hdx.scraper.unhabitat.router import ResourceRouter
+from hdx.scraper.unhabitat.table import RowSubset, RowTable
+
+
+class TestResourceRouter:
+    headers = ["Country", "Year", "Value"]
+    rows = [
+        ["Afghanistan", 2020, 1],
+        ["", 2020, 2],
+        ["Sudan", 2015, 3],
+        ["Afghanistan", None, 4],
+        ["France", 2010, 5],
+    ]
+    iso3s = {"Afghanistan": "AFG", "Sudan": "SDN", "France": "FRA"}
+
+    def test_route_date_header(self):
+        resource_info = {"country_header": "Country", "date_header": ["Year"]}
+        router = ResourceRouter(
+            "test", "resource_1", resource_info, ["AFG", "SDN"], self.headers
+        )
+        router.route(iter(self.rows), self.iso3s.get)
+        world = RowTable(
+            self.headers,
+            [("Afghanistan", 2020, 1), ("Sudan", 2015, 3), ("Afghanistan", None, 4)]
+            + [("France", 2010, 5)],
+        )
+        assert router.rows == {
+            "test_AFG": RowTable(self.headers, [world.rows[0], world.rows[2]]),
+            "test_SDN": RowTable(self.headers, [world.rows[1]]),
+            "test_world": world,
+        }
+        # Country datasets index into the world table rather than copying rows
+        country_rows = router.rows["test_AFG"]
+        assert isinstance(country_rows, RowSubset)
+        assert country_rows.table is router.rows["test_world"]
+        assert list(country_rows.indices) == [0, 2]
+        assert router.dates == {
+            "test_AFG": {2020},
+            "test_SDN": {2015},
+            "test_world": {2010, 2015, 2020},
+        }
+
+    def test_route_date_min_max(self):
+        resource_info = {
+            "country_header": "Country",
+            "date_min": 2000,
+            "date_max": 2005,
+        }
+        router = ResourceRouter(
+            "test", "resource_1", resource_info, ["SDN"], self.headers
+        )
+        router.route(iter(self.rows), self.iso3s.get)
+        assert list(router.rows) == ["test_SDN", "test_world"]
+        assert router.dates == {
+            "test_SDN": {2000, 2005},
+            "test_world": {2000, 2005},
+        }
@@ -0,0 +1,48 @@
+import os
+import pickle
+import subprocess
+import sys
+from os.path import abspath, join
+from shutil import copytree
+
+from hdx.location.country import Country
+
+
+class TestRun:
+    def test_run(self, configuration, hdx_server, server_url, input_dir, tempdir):
+        # Run as in production from the entry script, whose file writing
+        # workers import it again when they start
+        country_snapshot_path = join(tempdir, "countries.pkl")
+        with open(country_snapshot_path, "wb") as file:
+            pickle.dump(Country.countriesdata(False), file)
+        copytree(input_dir, join(tempdir, "saved_data"))
+        process = subprocess.run(
+            [
+                sys.executable,
+                abspath("run.py"),
+                "--hdx-url",
+                server_url,
+                "--hdx-key",
+                "test",
+                "--user-agent",
+                "test",
+                "--no-save",
+                "--use-saved",
+                "--datasets",
+                "open_spaces",
+                "--countries",
+                "AFG",
+                "--country-snapshot-path",
+                country_snapshot_path,
+                "--generate-workers",
+                "2",
+            ],
+            capture_output=True,
+            cwd=tempdir,
+            env={**os.environ, "PYTHONPATH": os.pathsep.join(map(abspath, sys.path))},
+            text=True,
+            timeout=300,
+        )
+        assert process.returncode == 0, process.stderr[-2000:]
+        assert list(hdx_server.packages) == ["open-spaces-afg"]
+        assert len(hdx_server.packages["open-spaces-afg"]["resources"]) == 4
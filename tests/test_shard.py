@@ -0,0 +1,134 @@
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from os import listdir
+from os.path import join
+
+import pytest
+from hdx.location.country import Country
+from hdx.utilities.loader import load_json
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.unhabitat.shard import (
+    check_shards,
+    get_shard,
+    get_shared_batch,
+    save_result,
+)
+
+
+class TestShard:
+    def test_get_shard(self):
+        dataset_names = [f"open_spaces_{iso3}" for iso3 in ("AFG", "BGD", "COL")]
+        dataset_names.append("open_spaces_world")
+        shards = [get_shard(dataset_names, index, 3) for index in range(3)]
+        assert shards == [
+            ["open_spaces_AFG", "open_spaces_world"],
+            ["open_spaces_BGD"],
+            ["open_spaces_COL"],
+        ]
+        assert get_shard(dataset_names, 0, 1) == dataset_names
+        with pytest.raises(ValueError):
+            get_shard(dataset_names, 3, 3)
+        with pytest.raises(ValueError):
+            get_shard(dataset_names, 0, 0)
+
+    def test_shared_batch(self):
+        with temp_dir(
+            "TestSharedBatch",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as tempdir:
+            with ProcessPoolExecutor(4, mp_context=get_context("spawn")) as executor:
+                batches = set(executor.map(get_shared_batch, [tempdir] * 8))
+            assert len(batches) == 1
+            batch = batches.pop()
+            assert get_shared_batch(tempdir, batch) == batch
+            with pytest.raises(ValueError):
+                get_shared_batch(tempdir, "other")
+
+    def test_check_shards(self):
+        dataset_names = ["open_spaces_AFG", "open_spaces_BGD", "open_spaces_world"]
+        with temp_dir(
+            "TestCheckShards",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as tempdir:
+            save_result(tempdir, 0, 2, "batch", get_shard(dataset_names, 0, 2), 0)
+            with pytest.raises(ValueError, match="shard 1 did not complete"):
+                check_shards(tempdir, 2, dataset_names)
+            save_result(tempdir, 1, 2, "batch", get_shard(dataset_names, 1, 2), 1)
+            with pytest.raises(ValueError, match="shard 1 had 1 errors"):
+                check_shards(tempdir, 2, dataset_names)
+            save_result(tempdir, 1, 2, "batch", get_shard(dataset_names, 1, 2), 0)
+            assert check_shards(tempdir, 2, dataset_names) == "batch"
+            with pytest.raises(ValueError, match="no shard generated open_spaces_COL"):
+                check_shards(tempdir, 2, dataset_names + ["open_spaces_COL"])
+            save_result(tempdir, 1, 2, "other", get_shard(dataset_names, 1, 2), 0)
+            with pytest.raises(ValueError, match="different batches"):
+                check_shards(tempdir, 2, dataset_names)
+
+    @pytest.mark.parametrize("source_cache", [True, False])
+    def test_sharded_main(
+        self, configuration, hdx_server, run_main_processes, source_cache
+    ):
+        with temp_dir(
+            "TestShardedMain",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as tempdir:
+            # The shards load Country data from a snapshot rather than the
+            # OCHA countries feed
+            country_snapshot_path = join(tempdir, "countries.pkl")
+            with open(country_snapshot_path, "wb") as file:
+                pickle.dump(Country.countriesdata(False), file)
+            source_cache_dir = join(tempdir, "sources") if source_cache else None
+
+            def run(shard_dir):
+                # Shards run with the default flags, so they save the sources
+                # they download
+                shards = [
+                    {
+                        "shard_index": shard_index,
+                        "shard_count": 2,
+                        "shard_dir": shard_dir,
+                        "source_cache_dir": source_cache_dir,
+                        "manifest_path": join(tempdir, f"manifest_{shard_index}.json"),
+                        "country_snapshot_path": country_snapshot_path,
+                    }
+                    for shard_index in range(2)
+                ]
+                assert run_main_processes(shards, tempdir) == [0, 0]
+                coordinator = {
+                    "coordinate": True,
+                    "shard_count": 2,
+                    "shard_dir": shard_dir,
+                    "source_cache_dir": source_cache_dir,
+                }
+                assert run_main_processes([coordinator], tempdir) == [0]
+
+            run(join(tempdir, "run1"))
+            # Each shard keeps the sources it saved rather than emptying a
+            # folder the other shard is using
+            for shard_index in range(2):
+                saved_dir = join(tempdir, f"saved_data-shard{shard_index}")
+                assert len(listdir(saved_dir)) == 2
+            packages = hdx_server.packages
+            assert sorted(packages) == ["open-spaces-afg", "open-spaces-world"]
+            assert (
+                packages["open-spaces-afg"]["batch"]
+                == (packages["open-spaces-world"]["batch"])
+            )
+            for shard_index in range(2):
+                manifest = load_json(join(tempdir, f"manifest_{shard_index}.json"))
+                assert list(manifest["inputs"]) == ["open_spaces"]
+
+            # A rerun of the shards skips the unchanged sources so nothing is
+            # uploaded
+            actions = list(hdx_server.actions)
+            run(join(tempdir, "run2"))
+            assert [
+                action
+                for action in hdx_server.actions[len(actions) :]
+                if action.startswith("package_")
+            ] == []
@@ -0,0 +1,85 @@
+from os import listdir
+from os.path import join
+from shutil import copyfile
+
+import pytest
+from hdx.utilities.downloader import Download
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.unhabitat.sheet_cache import SheetCache
+
+pytest.importorskip("pyarrow")
+
+
+class TestSheetCache:
+    def test_sheet_cache(self, input_dir):
+        with temp_dir(
+            "TestSheetCache",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as tempdir:
+            path = join(tempdir, "source.xlsx")
+            copyfile(
+                join(input_dir, "fbb02b19d417497093418484448e3465-data.xlsx"), path
+            )
+            folder = join(tempdir, "cache")
+            with Download(user_agent="test") as downloader:
+                expected_headers, iterator = downloader.get_tabular_rows(
+                    path, headers=1, format="xlsx", dict_form=False
+                )
+                expected_rows = list(iterator)
+
+                def get_rows(sheet_cache, **kwargs):
+                    headers, iterator = sheet_cache.get_tabular_rows(
+                        downloader, path, headers=1, format="xlsx", **kwargs
+                    )
+                    rows = list(iterator)
+                    assert headers == expected_headers
+                    assert rows == expected_rows
+                    for row, expected_row in zip(rows, expected_rows):
+                        assert list(map(type, row)) == list(map(type, expected_row))
+
+                sheet_cache = SheetCache(folder)
+                get_rows(sheet_cache)
+                assert (sheet_cache.hits, sheet_cache.misses) == (0, 1)
+                sheet_cache = SheetCache(folder)
+                get_rows(sheet_cache)
+                assert (sheet_cache.hits, sheet_cache.misses) == (1, 0)
+                get_rows(sheet_cache, sheet=1)
+                assert (sheet_cache.hits, sheet_cache.misses) == (1, 1)
+                assert len(sheet_cache.entries) == 2
+
+                sheet_cache.max_size = 1
+                sheet_cache.evict()
+                assert sheet_cache.entries == {}
+                assert listdir(folder) == ["index.json"]
+                get_rows(sheet_cache)
+                sheet_cache.max_size = None
+                sheet_cache.max_age = -1
+                sheet_cache.evict()
+                assert sheet_cache.entries == {}
+
+    def test_shared_sheet_cache(self, input_dir):
+        with temp_dir(
+            "TestSharedSheetCache",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as tempdir:
+            path = join(tempdir, "source.xlsx")
+            copyfile(
+                join(input_dir, "fbb02b19d417497093418484448e3465-data.xlsx"), path
+            )
+            folder = join(tempdir, "cache")
+            with Download(user_agent="test") as downloader:
+                sheet_caches = [SheetCache(folder, shared=True) for _ in range(2)]
+                for headers, sheet_cache in enumerate(sheet_caches, start=1):
+                    _, iterator = sheet_cache.get_tabular_rows(
+                        downloader, path, headers=headers, format="xlsx"
+                    )
+                    list(iterator)
+                # The second cache keeps the entry the first one wrote
+                assert len(sheet_caches[1].entries) == 2
+                sheet_cache = SheetCache(folder)
+                assert len(sheet_cache.entries) == 2
+                sheet_cache.get_tabular_rows(downloader, path, headers=1, format="xlsx")
+                assert (sheet_cache.hits, sheet_cache.misses) == (1, 0)
@@ -0,0 +1,130 @@
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from os import listdir
+from os.path import basename, exists
+from threading import Thread
+
+import pytest
+from hdx.utilities.downloader import Download, DownloadError
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.unhabitat.source_cache import SourceCache
+
+
+def download_shared(folder, url):
+    with Download(user_agent="test") as downloader:
+        source_cache = SourceCache(folder, ttl=3600, shared=True)
+        path, _ = source_cache.download_file(downloader.session, url, "a.xlsx")
+        return path, source_cache.downloaded
+
+
+class Handler(BaseHTTPRequestHandler):
+    files = {}
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path not in self.files:
+            self.send_error(404)
+            return
+        content = self.files[self.path]
+        etag = f'"{hash(content)}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", "Mon, 01 Jan 2024 00:00:00 GMT")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestSourceCache:
+    def test_source_cache(self, server_url):
+        Handler.files = {"/a": b"a" * 100, "/b": b"b" * 100}
+        Handler.requests = []
+        with temp_dir(
+            "TestSourceCache",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as tempdir:
+            with Download(user_agent="test") as downloader:
+                session = downloader.session
+                source_cache = SourceCache(tempdir)
+                path, nbytes = source_cache.download_file(
+                    session, f"{server_url}/a", "a.xlsx"
+                )
+                with open(path, "rb") as file:
+                    assert file.read() == b"a" * 100
+                assert nbytes == 100
+                # Nothing is transferred when the file is not modified
+                assert source_cache.download_file(
+                    session, f"{server_url}/a", "a.xlsx"
+                ) == (path, 0)
+                assert Handler.requests[0] == ("/a", None)
+                assert Handler.requests[1][1] is not None
+                assert source_cache.downloaded == 1
+                assert source_cache.not_modified == 1
+
+                Handler.files["/a"] = b"c" * 50
+                source_cache = SourceCache(tempdir)
+                path, nbytes = source_cache.download_file(
+                    session, f"{server_url}/a", "a.xlsx"
+                )
+                with open(path, "rb") as file:
+                    assert file.read() == b"c" * 50
+                assert nbytes == 50
+                assert source_cache.downloaded == 1
+
+                source_cache = SourceCache(tempdir, ttl=3600, max_size=100)
+                assert source_cache.download_file(
+                    session, f"{server_url}/a", "a.xlsx"
+                ) == (path, 0)
+                assert source_cache.fresh == 1
+                assert len(Handler.requests) == 3
+                path_b, _ = source_cache.download_file(
+                    session, f"{server_url}/b", "b.xlsx"
+                )
+                with pytest.raises(DownloadError):
+                    source_cache.download_file(session, f"{server_url}/c", "c.xlsx")
+                assert not any(file.endswith(".part") for file in listdir(tempdir))
+                source_cache.evict()
+                assert not exists(path)
+                assert exists(path_b)
+                entries = SourceCache(tempdir).entries.values()
+                assert [entry["file"] for entry in entries] == [basename(path_b)]
+
+    def test_shared_source_cache(self, server_url):
+        Handler.files = {"/a": b"a" * 100}
+        Handler.requests = []
+        with temp_dir(
+            "TestSharedSourceCache",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as tempdir:
+            with ProcessPoolExecutor(4, mp_context=get_context("spawn")) as executor:
+                results = list(
+                    executor.map(
+                        download_shared, [tempdir] * 4, [f"{server_url}/a"] * 4
+                    )
+                )
+            assert len({path for path, _ in results}) == 1
+            assert sum(downloaded for _, downloaded in results) == 1
+            assert Handler.requests == [("/a", None)]
+            assert len(SourceCache(tempdir).entries) == 1
@@ -0,0 +1,41 @@
+import json
+import os
+import subprocess
+import sys
+
+# Generous so that slow CI machines pass while regressions that import pandas
+# or load Country data on startup, which each add about half a second, fail
+_BUDGET_SECONDS = 3
+
+_SCRIPT = """
+import json
+import sys
+from time import perf_counter
+
+start = perf_counter()
+import hdx.scraper.unhabitat.__main__
+
+seconds = perf_counter() - start
+modules = [
+    module
+    for module in ("pandas", "pyarrow", "hdx.location.country", "hxl")
+    if module in sys.modules
+]
+print(json.dumps({"seconds": seconds, "modules": modules}))
+"""
+
+
+class TestStartup:
+    def test_import_time(self):
+        output = subprocess.run(
+            [sys.executable, "-c", _SCRIPT],
+            capture_output=True,
+            check=True,
+            text=True,
+            env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        ).stdout
+        result = json.loads(output.splitlines()[-1])
+        assert result["modules"] == []
+        assert result["seconds"] < _BUDGET_SECONDS, (
+            f"Import of hdx.scraper.unhabitat.__main__ took {result['seconds']:.3f}s"
+        )
@@ -0,0 +1,53 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from os import listdir
+from os.path import join
+
+import pytest
+from hdx.utilities.loader import load_json
+from hdx.utilities.path import temp_dir
+
+from hdx.scraper.unhabitat.storage import atomic_path, atomic_save_json
+
+
+def save_value(path, value):
+    for _ in range(20):
+        atomic_save_json({"value": value, "padding": "x" * 10000}, path)
+
+
+class TestStorage:
+    def test_atomic_save_json(self):
+        with temp_dir(
+            "TestAtomicSaveJson",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as tempdir:
+            path = join(tempdir, "index.json")
+            with ProcessPoolExecutor(
+                max_workers=4, mp_context=get_context("spawn")
+            ) as executor:
+                futures = [
+                    executor.submit(save_value, path, value) for value in range(4)
+                ]
+                for future in futures:
+                    future.result()
+            assert load_json(path)["value"] in range(4)
+            assert listdir(tempdir) == ["index.json"]
+
+    def test_atomic_path_failure(self):
+        with temp_dir(
+            "TestAtomicPathFailure",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as tempdir:
+            path = join(tempdir, "data.bin")
+            with open(path, "wb") as file:
+                file.write(b"old")
+            with pytest.raises(ValueError):
+                with atomic_path(path) as temp_path:
+                    with open(temp_path, "wb") as file:
+                        file.write(b"ne")
+                    raise ValueError("interrupted")
+            with open(path, "rb") as file:
+                assert file.read() == b"old"
+            assert listdir(tempdir) == ["data.bin"]
@@ -0,0 +1,40 @@
+import pickle
+from array import array
+
+from hdx.scraper.unhabitat.table import (
+    NUMBER,
+    OTHER,
+    STRING,
+    RowSubset,
+    RowTable,
+)
+
+
+class TestTable:
+    headers = ["Country", "Year", "Value"]
+
+    def test_table(self):
+        table = RowTable(self.headers)
+        table.append(["Afghanistan", 2020, 1.5])
+        table.append(["Sudan", 2015, None])
+        table.append(["Afghanistan", 2010, 2])
+        subset = RowSubset(table, array("L", [0, 2]))
+        assert len(subset) == 2
+        assert subset.headers == ("Country", "Year", "Value")
+        assert subset.to_dicts() == [
+            {"Country": "Afghanistan", "Year": 2020, "Value": 1.5},
+            {"Country": "Afghanistan", "Year": 2010, "Value": 2},
+        ]
+        df = subset.to_dataframe()
+        assert list(df.columns) == self.headers
+        assert str(df["Value"].dtype) == "float64"
+
+        assert subset.get_column_kinds() == (STRING, NUMBER, NUMBER)
+        mixed = RowTable(self.headers, [("Sudan", "2015", None), (None, 2015, True)])
+        assert mixed.get_column_kinds() == (STRING, OTHER, OTHER)
+
+        unpickled = pickle.loads(pickle.dumps(subset))
+        assert isinstance(unpickled, RowTable)
+        assert unpickled.column_kinds == (STRING, NUMBER, NUMBER)
+        assert unpickled == subset
+        assert len(unpickled.rows) == 2
@@ -1,5 +1,7 @@
+from copy import deepcopy
 from os.path import join
 
+import pytest
 from hdx.utilities.compare import assert_files_same
 from hdx.utilities.downloader import Download
 from hdx.utilities.errors_onexit import ErrorsOnExit
@@ -89,7 +91,12 @@ class TestUNHabitat:
         "url_type": "upload",
     }
 
-    def test_unhabitat(self, configuration, fixtures_dir, input_dir, config_dir):
+    @pytest.mark.parametrize(
+        "options", [{}, {"streaming": True}, {"engine": "columnar"}]
+    )
+    def test_unhabitat(
+        self, configuration, fixtures_dir, input_dir, config_dir, options
+    ):
         with temp_dir(
             "Testunhabitat",
             delete_on_success=True,
@@ -105,7 +112,9 @@ class TestUNHabitat:
                     use_saved=True,
                 )
                 configuration["countries"] = ["AFG"]
-                unhabitat = UNHabitat(configuration, retriever, tempdir, ErrorsOnExit())
+                unhabitat = UNHabitat(
+                    configuration, retriever, tempdir, ErrorsOnExit(), **options
+                )
                 dataset_names = unhabitat.get_data(datasets=["open_spaces"])
                 assert dataset_names == [
                     "open_spaces_AFG",
@@ -128,3 +137,84 @@ class TestUNHabitat:
                     read_excel(join(fixtures_dir, file)),
                     read_excel(join(tempdir, file)),
                 )
+
+    def test_get_data_download_failure(
+        self, configuration, make_unhabitat, retriever, tempdir
+    ):
+        retriever.use_saved = False
+        config = deepcopy(dict(configuration))
+        dataset_info = deepcopy(config["datasets"]["open_spaces"])
+        for resource_info in dataset_info["resources"].values():
+            resource_info["base_url"] = f"file://{join(tempdir, 'missing')}"
+        config["datasets"]["broken"] = dataset_info
+        errors = ErrorsOnExit()
+        unhabitat = make_unhabitat(config, errors=errors, max_workers=2)
+        dataset_names = unhabitat.get_data(datasets=["broken"])
+        assert dataset_names == []
+        assert len(errors.shared_errors["error"]["broken"]) == 2
+
+    def test_load_dataset_parse_failure(self, make_unhabitat):
+        errors = ErrorsOnExit()
+        unhabitat = make_unhabitat(errors=errors)
+        resource_info = unhabitat.configuration["datasets"]["open_spaces"]["resources"][
+            "resource_2"
+        ]
+        resource_info["country_header"] = "Missing"
+        unhabitat.load_dataset("open_spaces")
+        assert len(errors.shared_errors["error"]["open_spaces"]) == 1
+        # Rows routed from resource_1 before resource_2 failed are dropped
+        assert unhabitat.data == {}
+        assert unhabitat.loaded == set()
+        assert unhabitat.generate_dataset("open_spaces_AFG") is None
+
+        resource_info["country_header"] = "Country or Territory Name"
+        dataset = unhabitat.generate_dataset("open_spaces_AFG")
+        assert len(dataset.get_resources()) == 4
+        assert unhabitat.loaded == {"open_spaces"}
+
+    def test_write_files(self, make_unhabitat, tempdir, fixtures_dir):
+        unhabitat = make_unhabitat()
+        dataset_names = unhabitat.get_data(datasets=["open_spaces"])
+        assert unhabitat.write_files(dataset_names, 2) == dataset_names
+        dataset = unhabitat.generate_dataset("open_spaces_AFG", write_files=False)
+        assert len(dataset.get_resources()) == 4
+        file = "SDG_11-7-1_AFG.csv"
+        assert_files_same(join(fixtures_dir, file), join(tempdir, file))
+        file = "SDG_11-7-1_AFG.xlsx"
+        testing.assert_frame_equal(
+            read_excel(join(fixtures_dir, file)),
+            read_excel(join(tempdir, file)),
+        )
+
+    def test_lazy_generation(self, make_unhabitat, tempdir, fixtures_dir):
+        unhabitat = make_unhabitat(countries=("AFG", "ATA"))
+        dataset_names = unhabitat.get_dataset_names(
+            ["open_spaces", "urban_transport"], ["AFG", "ATA"]
+        )
+        assert dataset_names == [
+            "open_spaces_AFG",
+            "open_spaces_ATA",
+            "urban_transport_AFG",
+            "urban_transport_ATA",
+        ]
+        assert unhabitat.get_dataset_names(["open_spaces"], ["world"]) == [
+            "open_spaces_world"
+        ]
+        with pytest.raises(ValueError):
+            unhabitat.get_dataset_names(["unknown"])
+        with pytest.raises(ValueError):
+            unhabitat.get_dataset_names(["urban_environment"], ["AFG"])
+        with pytest.raises(ValueError):
+            unhabitat.get_dataset_names(["open_spaces"], ["AFG", "XYZ"])
+        assert unhabitat.loaded == set()
+
+        dataset = unhabitat.generate_dataset("open_spaces_AFG")
+        assert dataset["name"] == "open-spaces-afg"
+        assert unhabitat.loaded == {"open_spaces"}
+        assert unhabitat.generate_dataset("open_spaces_ATA") is None
+        file = "SDG_11-7-1_AFG.csv"
+        assert_files_same(join(fixtures_dir, file), join(tempdir, file))
+        table = unhabitat.data["open_spaces_world"]["resource_1"]
+        assert table.encoded_csv is not None
+        unhabitat.generate_dataset("open_spaces_world")
+        assert table.encoded_csv is None
@@ -0,0 +1,152 @@
+from array import array
+from os.path import exists, join
+
+from hdx.utilities.compare import assert_files_same
+from hdx.utilities.dictandlist import write_list_to_csv
+from hdx.utilities.path import temp_dir
+from openpyxl import load_workbook
+from pandas import DataFrame, read_excel, testing
+
+from hdx.scraper.unhabitat.table import RowSubset, RowTable
+from hdx.scraper.unhabitat.writers import (
+    StreamingWriter,
+    write_csv,
+    write_xlsx_pandas,
+    write_xlsx_table,
+)
+
+
+class TestWriters:
+    headers = ["Country", "Year", "Value", "Count", "Notes"]
+    rows = [
+        {"Country": "Afghanistan", "Year": 2020, "Value": 1.5, "Count": 3, "Notes": ""},
+        {
+            "Country": "Sudan",
+            "Year": 2019,
+            "Value": None,
+            "Count": None,
+            "Notes": "a,b",
+        },
+        {"Country": "Yemen", "Year": 2018, "Value": 2, "Count": 4, "Notes": None},
+    ]
+
+    def test_streaming_writer(self):
+        with temp_dir(
+            "TestStreamingWriter",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as tempdir:
+            writer = StreamingWriter(tempdir, "test_AFG", self.headers)
+            for row in self.rows:
+                writer.append([row[header] for header in self.headers])
+            writer.close()
+            assert len(writer) == 3
+
+            expected_path = join(tempdir, "expected.csv")
+            write_list_to_csv(
+                expected_path, self.rows, columns=self.headers, encoding="utf-8"
+            )
+            assert_files_same(expected_path, writer.paths["csv"])
+            expected_path = join(tempdir, "expected.xlsx")
+            DataFrame(self.rows).to_excel(expected_path, index=False)
+            testing.assert_frame_equal(
+                read_excel(expected_path), read_excel(writer.paths["xlsx"])
+            )
+            assert [
+                column_types.is_float() for column_types in writer.column_types
+            ] == [False, False, True, True, False]
+            # The integers of Count come before its missing value but are
+            # formatted as floats as pandas reads the column as float64
+            worksheet = load_workbook(writer.paths["xlsx"]).active
+            expected_path = join(tempdir, "expected_pandas.xlsx")
+            table = RowTable(
+                self.headers,
+                [tuple(row[header] for header in self.headers) for row in self.rows],
+            )
+            write_xlsx_pandas(expected_path, "test_AFG", table)
+            expected_worksheet = load_workbook(expected_path).active
+            assert [cell.number_format for cell in worksheet["D"][1:]] == [
+                "0.0",
+                "General",
+                "0.0",
+            ]
+            assert [
+                [(cell.value, cell.number_format) for cell in row]
+                for row in worksheet.iter_rows(min_row=2)
+            ] == [
+                [(cell.value, cell.number_format) for cell in row]
+                for row in expected_worksheet.iter_rows(min_row=2)
+            ]
+
+    def test_write_csv(self):
+        with temp_dir(
+            "TestWriteCsv",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as tempdir:
+            table = RowTable(["Country", "Value", "Value", "", "Notes"])
+            table.append(["Afghanistan", 1.5, 1e-07, None, 'a "b", c'])
+            table.append([None, None, None, None, ""])
+            table.append(["Côte d'Ivoire", 10**20, float("nan"), True, "x\r\ny"])
+            table.append(["Yemen", -3, float("inf"), False, "中"])
+            subset = RowSubset(table, array("L", [0, 1, 3]))
+            for name, rows in (("table", table), ("subset", subset)):
+                expected_path = join(tempdir, f"expected_{name}.csv")
+                write_list_to_csv(
+                    expected_path,
+                    list(rows),
+                    headers=list(rows.headers),
+                    encoding="utf-8",
+                )
+                path = join(tempdir, f"{name}.csv")
+                write_csv(path, rows)
+                with open(expected_path, "rb") as expected_file:
+                    with open(path, "rb") as file:
+                        assert file.read() == expected_file.read()
+            assert table.encoded_csv is not None
+            path = join(tempdir, "empty.csv")
+            write_csv(path, RowSubset(table))
+            assert not exists(path)
+
+    def test_write_xlsx_table(self):
+        with temp_dir(
+            "TestWriteXlsxTable",
+            delete_on_success=True,
+            delete_on_failure=False,
+        ) as tempdir:
+            table = RowTable(self.headers)
+            for row in self.rows:
+                table.append([row[header] for header in self.headers])
+            table.append(["=SUM(1)", 2017, float("nan"), float("inf"), "https://a.b"])
+            table.append(["Iraq", None, 3.25, 5, "x:y"])
+            expected_path = join(tempdir, "expected.xlsx")
+            write_xlsx_pandas(expected_path, "test", table)
+            path = join(tempdir, "test.xlsx")
+            write_xlsx_table(path, "test", table)
+
+            def get_cells(path):
+                worksheet = load_workbook(path).active
+                return [
+                    [
+                        (
+                            cell.value,
+                            cell.data_type,
+                            cell.number_format,
+                            cell.hyperlink.target if cell.hyperlink else None,
+                        )
+                        for cell in row
+                    ]
+                    for row in worksheet.iter_rows(min_row=2)
+                ]
+
+            cells = get_cells(path)
+            assert cells == get_cells(expected_path)
+            assert [cell[2] for cell in cells[0]] == [
+                "General",
+                "0.0",
+                "0.0",
+                "0.0",
+                "General",
+            ]
+            assert cells[3][0][:2] == ("=SUM(1)", "f")
+            assert cells[3][4][3] == "https://a.b"